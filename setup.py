@@ -25,13 +25,22 @@ setup(
     install_requires=[
         'setuptools>=17.1',
         'requests>=2.4.2',
+        'urllib3>=1.26',
         'pytest-runner',
         'Jinja2',
         'six',
         'prettytable',
     ],
-    extras_require={'test': [
-        'pytest-mock',
-        'requests-mock',
-    ]},
+    extras_require={
+        'test': [
+            'pytest-mock',
+            'requests-mock',
+        ],
+        'lxml': [
+            'lxml>=5',
+        ],
+        'zstd': [
+            'zstandard',
+        ],
+    },
 )
@@ -1,10 +1,17 @@
 import sys
+import threading
+import time
 
 import pytest
 
 from xunit2testrail import cmd
 
 
+@pytest.fixture(autouse=True)
+def warm_up(mocker):
+    return mocker.patch('xunit2testrail.reporter.Reporter.warm_up')
+
+
 def test_parse_args_return_not_bytes():
     parsed_args = cmd.parse_args(
         ['--iso-id', '1', 'tests/xunit_files/report.xml'])
@@ -54,3 +61,60 @@ def test_dry_run_not_create_entities_in_testrail(mocker, method):
     mocker.patch.object(sys, 'argv', testargs)
     cmd.main()
     assert not method_mock.called
+
+
+def test_parse_args_several_reports():
+    parsed_args = cmd.parse_args(
+        ['--iso-id', '1', 'tests/xunit_files/report.xml', 'tests/xunit_files',
+         'tests/xunit_files/*.xml'])
+    assert parsed_args.xunit_report == ['tests/xunit_files/report.xml',
+                                        'tests/xunit_files',
+                                        'tests/xunit_files/*.xml']
+
+
+def test_report_buffers_cases_until_warm_up(mocker):
+    reporter = mocker.Mock()
+    started = threading.Event()
+    finished = threading.Event()
+    parsed = []
+
+    def warm_up():
+        started.wait(5)
+        finished.set()
+
+    def iter_xunit_cases():
+        for i in range(10):
+            parsed.append(i)
+            if i == 2:
+                started.set()
+                finished.wait(5)
+                time.sleep(0.1)
+            yield i
+
+    def map_cases(xunit_cases):
+        consumed = len(parsed)
+        return {'cases': list(xunit_cases), 'parsed': consumed}
+
+    reporter.warm_up.side_effect = warm_up
+    reporter.iter_xunit_cases.side_effect = iter_xunit_cases
+    reporter.map_cases.side_effect = map_cases
+    args = mocker.Mock(dry_run=True)
+    print_mapping = mocker.patch.object(cmd, 'print_mapping_table')
+    cmd.report(reporter, args)
+    mapping = print_mapping.call_args[0][0]
+    assert mapping['cases'] == list(range(10))
+    assert mapping['parsed'] == 3
+
+
+def test_parse_args_mirror_full_sync():
+    parsed_args = cmd.parse_args(
+        ['--iso-id', '1', 'tests/xunit_files/report.xml',
+         '--testrail-mirror-full-sync', '12'])
+    assert parsed_args.testrail_mirror_full_sync == 12
+
+
+@pytest.mark.parametrize('workers', ['0', '-1', 'x'])
+def test_parse_args_wrong_xunit_workers(workers):
+    with pytest.raises(SystemExit):
+        cmd.parse_args(['--iso-id', '1', 'tests/xunit_files/report.xml',
+                        '--xunit-workers', workers])
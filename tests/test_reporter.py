@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
+import collections
+import copy
 import datetime
+import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 import six
@@ -117,3 +123,226 @@ def test_paste_store_data(api_mock, reporter, xunit_case, paste_api, prop,
     assert value in payload['code']
     for absent_prop in absent_props:
         assert absent_prop not in payload['code']
+
+
+def test_reporter_reuses_client(reporter, mocker):
+    client = reporter.testrail_client
+    assert reporter.testrail_client is client
+    close = mocker.patch.object(client, 'close')
+    with reporter:
+        pass
+    assert close.called
+    assert reporter.testrail_client is not client
+
+
+def test_fill_case_results_keeps_order(reporter, mocker):
+    from xunit2testrail.vendor.xunitparser import TestCase as XunitCase
+    reporter.result_workers = 4
+    mapping = collections.OrderedDict()
+    for i in range(20):
+        xunit_case = XunitCase(classname='a.T', methodname='test_{}'.format(i))
+        xunit_case.result = 'skipped' if i % 3 == 0 else 'success'
+        xunit_case.time = datetime.timedelta(seconds=i)
+        mapping[Case(id=i)] = xunit_case
+    cases = reporter.fill_case_results(mapping)
+    assert [x.id for x in cases] == [i for i in range(20) if i % 3]
+    assert all(x.result.status_id == 1 for x in cases)
+
+
+def test_paste_failure_is_logged(reporter, xunit_case, api_mock, mocker):
+    xunit_case.result = 'failure'
+    xunit_case.trace = 'trace'
+    api_mock.register_uri('POST', re.compile('http://example.com/'),
+                          status_code=500)
+    reporter.paste_retries = 0
+    logger = mocker.patch('xunit2testrail.reporter.logger')
+    comment = reporter.gen_testrail_comment(xunit_case)
+    assert 'Trace, logs' not in comment
+    assert logger.warning.called
+
+
+def test_paste_session_retries(reporter, xunit_case, api_mock, paste_api):
+    adapter = reporter.paste_session.get_adapter('http://example.com/')
+    assert adapter.max_retries.total == reporter.paste_retries
+    assert 'POST' in adapter.max_retries.allowed_methods
+    reporter.save_to_paste(xunit_case)
+    assert reporter.paste_session is reporter.paste_session
+
+
+def test_paste_is_uploaded_once(api_mock, reporter, xunit_case, paste_api):
+    xunit_case.trace = 'same trace'
+    links = [reporter.save_to_paste(xunit_case) for _ in range(3)]
+    assert links == ["http://example.com/show/123/"] * 3
+    assert api_mock.call_count == 1
+
+    xunit_case.trace = 'other trace'
+    reporter.save_to_paste(xunit_case)
+    assert api_mock.call_count == 2
+
+
+def test_paste_upload_in_progress_is_reused(reporter, xunit_case, mocker):
+    started = threading.Event()
+    release = threading.Event()
+
+    def post(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return mock.Mock(**{'json.return_value': {'data': '7'}})
+
+    post = mocker.patch.object(reporter.paste_session, 'post',
+                               side_effect=post)
+    xunit_case.trace = 'trace'
+    with ThreadPoolExecutor(2) as executor:
+        first = executor.submit(reporter.save_to_paste, xunit_case)
+        started.wait(5)
+        second = executor.submit(reporter.save_to_paste, xunit_case)
+        release.set()
+        assert first.result() == second.result() == \
+            'http://example.com/show/7/'
+    assert post.call_count == 1
+
+
+def test_failed_paste_upload_in_progress(reporter, xunit_case, mocker):
+    started = threading.Event()
+    release = threading.Event()
+
+    def post(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        raise ValueError('paste is down')
+
+    mocker.patch.object(reporter.paste_session, 'post', side_effect=post)
+    xunit_case.trace = 'trace'
+    with ThreadPoolExecutor(2) as executor:
+        first = executor.submit(reporter.save_to_paste, xunit_case)
+        started.wait(5)
+        second = executor.submit(reporter.save_to_paste, xunit_case)
+        time.sleep(0.1)
+        # Second worker waits for the upload, not for the lock
+        assert reporter._pastes_lock.acquire(timeout=5)
+        reporter._pastes_lock.release()
+        release.set()
+        for future in (first, second):
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+    assert reporter._pastes == {}
+
+
+def test_failed_paste_is_uploaded_again(api_mock, reporter, xunit_case):
+    api_mock.register_uri('POST', re.compile('http://example.com/'),
+                          [{'status_code': 500}, {'json': {'data': '5'}}])
+    reporter.paste_retries = 0
+    xunit_case.trace = 'trace'
+    with pytest.raises(ValueError):
+        reporter.save_to_paste(xunit_case)
+    assert reporter.save_to_paste(xunit_case) == 'http://example.com/show/5/'
+
+
+def test_paste_cache_persisted(api_mock, reporter, xunit_case, paste_api,
+                               tmpdir):
+    reporter.paste_cache = str(tmpdir.join('pastes.json'))
+    xunit_case.trace = 'trace'
+    reporter.save_to_paste(xunit_case)
+    reporter.close()
+
+    reporter._pastes = None
+    assert reporter.save_to_paste(xunit_case) == \
+        'http://example.com/show/123/'
+    assert api_mock.call_count == 1
+
+
+@pytest.mark.parametrize('content', ['{"a": ', '["a"]'])
+def test_broken_paste_cache(api_mock, reporter, xunit_case, paste_api,
+                            tmpdir, content):
+    paste_cache = tmpdir.join('pastes.json')
+    paste_cache.write(content)
+    reporter.paste_cache = str(paste_cache)
+    xunit_case.trace = 'trace'
+    assert reporter.save_to_paste(xunit_case) == \
+        'http://example.com/show/123/'
+    reporter.close()
+    assert list(json.loads(paste_cache.read()).values()) == \
+        ['http://example.com/show/123/']
+
+
+def test_status_ids_first_match_wins(reporter, mocker):
+    mocker.patch.object(type(reporter), 'testrail_statuses',
+                        new_callable=mock.PropertyMock,
+                        return_value={5: 'failed', 1: 'passed', 7: 'failed'})
+    assert reporter.testrail_status_ids == {'failed': 5, 'passed': 1}
+
+
+def test_comments_batch_render(reporter, xunit_case, mocker):
+    get_template = mocker.spy(reporter.env, 'get_template')
+    other = copy.copy(xunit_case)
+    other.methodname = 'test_other'
+    comments = reporter.gen_testrail_comments([xunit_case, other])
+    assert comments == [reporter.gen_testrail_comment(xunit_case),
+                        reporter.gen_testrail_comment(other)]
+    assert 'test_other' in comments[1]
+    assert get_template.call_count == 1
+
+
+def test_jenkins_prefix_follows_link(reporter, xunit_case):
+    reporter.test_results_link = 'http://other/'
+    assert reporter.get_jenkins_report_url(xunit_case).startswith(
+        'http://other/testReport/')
+
+
+def test_created_run_results(reporter, mocker):
+    run = mock.Mock(id=5)
+    reporter._created_runs[5] = [1, 2]
+    reporter.delta_results = True
+    reporter.add_results(run, ['cases'], plan='plan')
+    run.add_results_for_cases.assert_called_once_with(
+        ['cases'], case_ids=[1, 2], plan='plan')
+
+    found_run = mock.Mock(id=6)
+    reporter.add_results(found_run, ['cases'])
+    found_run.add_results_for_cases.assert_called_once_with(
+        ['cases'], only_changed=True, plan=None)
+
+
+def test_memoize_concurrent_calls(reporter, mocker):
+    barrier = threading.Barrier(4)
+
+    def make_client(**kwargs):
+        time.sleep(0.05)
+        return mock.Mock()
+
+    client_cls = mocker.patch('xunit2testrail.reporter.TrClient',
+                              side_effect=make_client)
+
+    def get_client(_):
+        barrier.wait()
+        return reporter.testrail_client
+
+    with ThreadPoolExecutor(4) as executor:
+        clients = list(executor.map(get_client, range(4)))
+
+    assert client_cls.call_count == 1
+    assert all(client is clients[0] for client in clients)
+
+
+@pytest.mark.parametrize('dry_run', [False, True])
+def test_warm_up(reporter, mocker, dry_run):
+    from xunit2testrail.reporter import Reporter
+    reporter.dry_run = dry_run
+    reporter.testrail_configuration_name = 'Config'
+    reporter._cache['testrail_client'] = client = mock.Mock()
+    client.statuses = {1: 'passed'}
+    project = client.projects.find.return_value
+    cases = mocker.patch.object(Reporter, 'cases',
+                                new_callable=mock.PropertyMock)
+
+    reporter.warm_up()
+
+    assert cases.called
+    assert reporter._cache['project'] is project
+    assert reporter._cache['milestone'] is project.milestones.find.return_value
+    cached = {'testrail_status_ids', 'find_plan', 'testrail_configuration'}
+    assert cached.isdisjoint(reporter._cache) == dry_run
+    assert not project.plans.add.called
+    if not dry_run:
+        assert reporter.get_or_create_plan() is project.plans.find.return_value
+        assert project.plans.find.call_count == 1
@@ -212,3 +212,81 @@ def test_no_testrail_case_logging(caplog, template_mapper, suite, milestone):
                           ))
 def test_truncate_head(banner, text, max_length, expected):
     assert utils.truncate_head(banner, text, max_length) == expected
+
+
+def test_match_case_group_duplicates(template_mapper):
+    from xunit2testrail.vendor import xunitparser
+    xunit_case = xunitparser.TestCase(classname='a.b.C',
+                                      methodname='test_a[(12345)]')
+    case = client.Case(custom_report_label='12345,12345')
+    result = template_mapper.get_suitable_cases(xunit_case, [case])
+    assert result == [case, case]
+
+
+def test_cases_index_built_once(template_mapper, mocker):
+    from xunit2testrail.vendor import xunitparser
+    cases = [client.Case(custom_report_label=str(x))
+             for x in range(12340, 12350)]
+    get_testrail_id = mocker.spy(template_mapper, 'get_testrail_id')
+    for case in cases:
+        xunit_case = xunitparser.TestCase(
+            classname='a.b.C',
+            methodname='test_a[({})]'.format(case.custom_report_label))
+        assert template_mapper.get_suitable_cases(xunit_case,
+                                                  cases) == [case]
+    assert get_testrail_id.call_count == len(cases)
+
+
+@pytest.mark.parametrize('template', [
+    '{id}',
+    '{classname}.{methodname}',
+    'prefix {{literal}} {title}',
+    '{title!r}',
+    '{title:>10}',
+    '{title[0]}',
+    'no fields',
+])
+def test_template_format(template):
+    values = {'id': '12345', 'classname': 'a.b', 'methodname': 'c',
+              'title': 'title'}
+    compiled = utils.Template(template)
+    assert compiled.format(values) == template.format(**values)
+
+
+def test_template_fields():
+    assert utils.template_fields('{a}.{b[0]}.{c.d}-{a}') == ['a', 'b', 'c']
+
+
+def test_xunit_id_computed_once(template_mapper, mocker):
+    from xunit2testrail.vendor import xunitparser
+    xunit_case = xunitparser.TestCase(classname='a.b.C',
+                                      methodname='test_a[(12345)]')
+    find_id = mocker.spy(utils, 'find_id')
+    find_uuid = mocker.spy(utils, 'find_uuid')
+    assert template_mapper.get_xunit_id(xunit_case) == '12345'
+    assert template_mapper.get_xunit_id(xunit_case) == '12345'
+    assert find_id.call_count == 1
+    assert not find_uuid.called
+
+
+def test_xunit_ids_are_not_kept(template_mapper):
+    from xunit2testrail.vendor import xunitparser
+    xunit_cases = [xunitparser.TestCase(classname='a.b.C',
+                                        methodname='test_a[({})]'.format(i))
+                   for i in (12345, 12346)]
+    for xunit_case in xunit_cases:
+        template_mapper.get_xunit_id(xunit_case)
+    assert template_mapper._last_xunit_id[0] is xunit_cases[-1]
+    assert template_mapper.get_xunit_id(xunit_cases[0]) == '12345'
+
+
+def test_atomic_write(tmpdir):
+    path = str(tmpdir.join('data.json'))
+    with utils.atomic_write(path) as f:
+        f.write('old')
+    with pytest.raises(ValueError):
+        with utils.atomic_write(path) as f:
+            f.write('new')
+            raise ValueError
+    assert tmpdir.listdir() == [tmpdir.join('data.json')]
+    assert tmpdir.join('data.json').read() == 'old'
@@ -0,0 +1,255 @@
+import os
+
+import pytest
+
+from xunit2testrail import xunit
+
+SHARD = '''<?xml version="1.0" encoding="utf-8"?>
+<testsuite name="{0}">
+  <testcase classname="{0}.Test" name="test_a"/>
+  <testcase classname="{0}.Test" name="test_b">
+    <failure message="boom">trace</failure>
+  </testcase>
+</testsuite>
+'''
+
+
+@pytest.fixture
+def shards(tmpdir):
+    for name in ('w1', 'w0', 'sub/w2'):
+        path = tmpdir.join(name + '.xml')
+        path.write(SHARD.format(os.path.basename(name)), ensure=True)
+    tmpdir.join('sub', 'notes.txt').write('not a report')
+    return tmpdir
+
+
+def test_find_reports_dir(shards):
+    reports = xunit.find_reports([str(shards)])
+    assert reports == [str(shards.join('sub', 'w2.xml')),
+                       str(shards.join('w0.xml')),
+                       str(shards.join('w1.xml'))]
+
+
+def test_find_reports_glob_and_files(shards):
+    reports = xunit.find_reports([str(shards.join('w1.xml')),
+                                  str(shards.join('w*.xml')),
+                                  str(shards.join('sub', 'w2.xml'))])
+    assert reports == [str(shards.join('sub', 'w2.xml')),
+                       str(shards.join('w0.xml')),
+                       str(shards.join('w1.xml'))]
+
+
+def test_find_reports_missing(tmpdir):
+    with pytest.raises(IOError):
+        xunit.find_reports([str(tmpdir.join('*.xml'))])
+    tmpdir.join('notes.txt').write('')
+    with pytest.raises(IOError):
+        xunit.find_reports([str(tmpdir)])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_iter_cases_order(shards, workers):
+    reports = xunit.find_reports([str(shards)])
+    cases = list(xunit.iter_cases(reports, workers=workers))
+    assert [x.id() for x in cases] == [
+        'w2.Test.test_a', 'w2.Test.test_b',
+        'w0.Test.test_a', 'w0.Test.test_b',
+        'w1.Test.test_a', 'w1.Test.test_b',
+    ]
+    assert cases[1].failed and cases[1].trace == 'trace'
+
+
+def test_workers_are_not_forked(shards, mocker):
+    pool = mocker.patch.object(xunit, 'ProcessPoolExecutor',
+                               wraps=xunit.ProcessPoolExecutor)
+    reports = xunit.find_reports([str(shards)])
+    assert len(list(xunit.iter_cases(reports, workers=2))) == 6
+    context = pool.call_args[1]['mp_context']
+    assert context.get_start_method() != 'fork'
+
+
+def test_parse_reports_merged(shards):
+    reports = xunit.find_reports([str(shards)])
+    suite, result = xunit.parse_reports(reports, workers=2)
+    assert suite.countTestCases() == 6
+    assert len(result.failures) == 3
+
+
+@pytest.mark.parametrize('compress', ['gzip', 'lzma'])
+def test_compressed_report(tmpdir, compress):
+    module = pytest.importorskip(compress)
+    with open('tests/xunit_files/report.xml', 'rb') as f:
+        data = f.read()
+    path = tmpdir.join('report.xml.archived')
+    path.write_binary(module.compress(data))
+    with open('tests/xunit_files/report.xml', 'rb') as f:
+        expected = [x.id() for x in xunit.xunitparser.iterparse(f)]
+
+    cases = list(xunit.iter_cases([str(path)]))
+    assert [x.id() for x in cases] == expected
+    suite, _ = xunit.parse_reports([str(path)])
+    assert [x.id() for x in suite] == expected
+
+
+def test_zstd_report(tmpdir):
+    zstandard = pytest.importorskip('zstandard')
+    path = tmpdir.join('report.xml.zst')
+    path.write_binary(zstandard.ZstdCompressor().compress(
+        SHARD.format('w0').encode()))
+    cases = list(xunit.iter_cases([str(path)]))
+    assert [x.id() for x in cases] == ['w0.Test.test_a', 'w0.Test.test_b']
+
+
+def test_zstd_is_not_installed(tmpdir, mocker):
+    mocker.patch.object(xunit, 'zstandard', None)
+    path = tmpdir.join('report.xml.zst')
+    path.write_binary(b'\x28\xb5\x2f\xfd' + b'\x00' * 10)
+    with pytest.raises(ImportError) as e:
+        xunit.open_report(str(path))
+    assert 'zstandard' in str(e.value)
+
+
+def test_find_compressed_reports(tmpdir):
+    for name in ('a.xml.gz', 'b.xml.xz', 'c.xml.zst', 'd.gz'):
+        tmpdir.join(name).write_binary(b'')
+    reports = xunit.find_reports([str(tmpdir)])
+    assert [os.path.basename(x) for x in reports] == ['a.xml.gz', 'b.xml.xz',
+                                                      'c.xml.zst']
+
+
+PAYLOADS = u'''<?xml version="1.0" encoding="utf-8"?>
+<testsuite name="lazy">
+  <testcase classname="a.T" name="test_ok" time="1">
+    <system-out>   </system-out>
+    <system-err/>
+  </testcase>
+  <testcase classname="a.T" name="test_fail" note="a > b">
+    <failure message="boom" type="Error">Trace &lt;&amp;&gt;
+ line 2 — done
+</failure>
+    <system-out><![CDATA[<out> & more]]>
+    </system-out>
+    <system-err>
+{err}
+    </system-err>
+  </testcase>
+</testsuite>
+'''
+
+FIELDS = ('classname', 'methodname', 'result', 'typename', 'message', 'trace',
+          'stdout', 'stderr')
+
+
+def case_fields(case):
+    values = []
+    for name in FIELDS:
+        value = getattr(case, name, None)
+        values.append(None if value is None else (str(value), bool(value)))
+    return tuple(values)
+
+
+@pytest.fixture
+def payloads_report(tmpdir):
+    err = u'\n'.join(u'err №{} &amp; <![CDATA[<x>]]>'.format(i)
+                     for i in range(2000))
+    path = tmpdir.join('payloads.xml')
+    path.write_binary(PAYLOADS.format(err=err).encode('utf-8'))
+    return str(path)
+
+
+@pytest.mark.parametrize('path', ['tests/xunit_files/report.xml', None])
+def test_lazy_payloads_parity(path, payloads_report):
+    path = path or payloads_report
+    expected = [case_fields(x) for x in xunit.iter_report(path)]
+    cases = list(xunit.iter_report(path, lazy_payloads=True))
+    assert [case_fields(x) for x in cases] == expected
+    assert any(isinstance(x.trace, xunit.LazyText) for x in cases)
+
+
+def test_lazy_text_tail(payloads_report):
+    case = list(xunit.iter_report(payloads_report, lazy_payloads=True))[-1]
+    stderr = str(case.stderr)
+    for size in (1, 10, 27, 100, 1000, len(stderr) + 10):
+        assert case.stderr.tail(size) == stderr[-size:]
+    assert case.trace.tail(5) == str(case.trace)[-5:]
+
+
+def test_lazy_text_pickle(payloads_report):
+    import pickle
+    case = list(xunit.iter_report(payloads_report, lazy_payloads=True))[-1]
+    restored = pickle.loads(pickle.dumps(case))
+    assert isinstance(restored.stderr, xunit.LazyText)
+    assert restored.stderr == str(case.stderr)
+
+
+def test_truncate_lazy_text(payloads_report):
+    from xunit2testrail.utils import truncate_head
+    case = list(xunit.iter_report(payloads_report, lazy_payloads=True))[-1]
+    for max_len in (20, 500, 10 ** 6):
+        assert truncate_head('### err\n', case.stderr, max_len) == \
+            truncate_head('### err\n', str(case.stderr), max_len)
+
+
+def test_lazy_payloads_with_entities(tmpdir):
+    path = tmpdir.join('entities.xml')
+    path.write(PAYLOADS.format(err='&foo;').replace(
+        '<testsuite', '<!DOCTYPE testsuite [<!ENTITY foo "FOO">]>\n'
+                      '<testsuite', 1))
+    expected = [case_fields(x) for x in xunit.iter_report(str(path))]
+    cases = list(xunit.iter_report(str(path), lazy_payloads=True))
+    assert [case_fields(x) for x in cases] == expected
+    assert cases[-1].stderr == 'FOO'
+
+
+def test_lazy_payloads_compressed(tmpdir):
+    import gzip
+    path = tmpdir.join('report.xml.gz')
+    with open('tests/xunit_files/report.xml', 'rb') as f:
+        path.write_binary(gzip.compress(f.read()))
+    cases = list(xunit.iter_report(str(path), lazy_payloads=True))
+    assert not any(isinstance(x.trace, xunit.LazyText) for x in cases)
+
+
+def test_report_cache(tmpdir, mocker):
+    report = tmpdir.join('report.xml')
+    report.write(SHARD.format('w0'))
+    cache_dir = str(tmpdir.join('cache'))
+    cases = xunit.parse_report(str(report), cache_dir=cache_dir)
+
+    iter_report = mocker.patch.object(xunit, 'iter_report')
+    cached = xunit.parse_report(str(report), cache_dir=cache_dir)
+    assert not iter_report.called
+    assert [case_fields(x) for x in cached] == [case_fields(x) for x in cases]
+
+
+def test_report_cache_skips_hashing_unchanged(tmpdir, mocker):
+    report = tmpdir.join('report.xml')
+    report.write(SHARD.format('w0'))
+    cache = xunit.ReportCache(str(tmpdir.join('cache')))
+    digest = cache.digest(str(report))
+
+    sha256 = mocker.spy(xunit.hashlib, 'sha256')
+    assert cache.digest(str(report)) == digest
+    assert not sha256.called
+
+
+def test_report_cache_changed_report(tmpdir):
+    report = tmpdir.join('report.xml')
+    report.write(SHARD.format('w0'))
+    cache_dir = str(tmpdir.join('cache'))
+    xunit.parse_report(str(report), cache_dir=cache_dir)
+
+    report.write(SHARD.format('w1'))
+    os.utime(str(report), ns=(0, 0))
+    cases = xunit.parse_report(str(report), cache_dir=cache_dir)
+    assert [x.id() for x in cases] == ['w1.Test.test_a', 'w1.Test.test_b']
+
+
+def test_report_cache_lazy_payloads(payloads_report, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    cases = xunit.parse_report(payloads_report, lazy_payloads=True,
+                               cache_dir=cache_dir)
+    cached = xunit.parse_report(payloads_report, lazy_payloads=True,
+                                cache_dir=cache_dir)
+    assert isinstance(cached[-1].stderr, xunit.LazyText)
+    assert [case_fields(x) for x in cached] == [case_fields(x) for x in cases]
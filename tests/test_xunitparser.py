@@ -0,0 +1,110 @@
+import io
+
+import pytest
+
+from xunit2testrail.vendor import xunitparser
+
+REPORT = 'tests/xunit_files/report.xml'
+
+FIELDS = ('classname', 'methodname', 'description', 'report_id', 'result',
+          'typename', 'message', 'trace', 'stdout', 'stderr', 'time')
+
+SUITES = b'''<?xml version="1.0" encoding="utf-8"?>
+<testsuites>
+  <testsuite name="first">
+    <properties><property name="a" value="1"/></properties>
+    <testcase classname="a.B" name="test_ok" time="1.5"/>
+    <testcase name="test_fail" time="2">
+      <failure message="boom" type="AssertionError">trace</failure>
+      <system-out>out</system-out>
+    </testcase>
+  </testsuite>
+  <testsuite name="second">
+    <testcase classname="c.D" name="test_skip">
+      <skipped message="skip"/>
+    </testcase>
+    <testcase classname="c.D"/>
+    <system-out>suite out</system-out>
+  </testsuite>
+</testsuites>
+'''
+
+
+def case_fields(case):
+    return tuple(getattr(case, field, None) for field in FIELDS)
+
+
+LXML = pytest.param('lxml', marks=pytest.mark.skipif(
+    xunitparser.lxml_etree is None, reason='lxml is not installed'))
+
+
+@pytest.mark.parametrize('backend', ['etree', LXML])
+@pytest.mark.parametrize('source', [REPORT, SUITES])
+def test_parse_parity(source, backend):
+    """parse and iterparse of each backend give the same cases"""
+    def open_source():
+        if isinstance(source, bytes):
+            return io.BytesIO(source)
+        return open(source, 'rb')
+
+    with open_source() as f:
+        expected, _ = xunitparser.Parser('etree').parse(f)
+    expected = [case_fields(x) for x in expected]
+    with open_source() as f:
+        suite, _ = xunitparser.parse(f, backend=backend)
+    assert [case_fields(x) for x in suite] == expected
+    with open_source() as f:
+        cases = list(xunitparser.iterparse(f, backend=backend))
+    assert [case_fields(x) for x in cases] == expected
+
+
+@pytest.mark.parametrize('backend', ['etree', LXML])
+def test_external_entities_not_resolved(tmpdir, backend):
+    secret = tmpdir.join('secret.txt')
+    secret.write('secret')
+    source = (
+        '<!DOCTYPE testsuite [<!ENTITY e SYSTEM "{}">]>'
+        '<testsuite name="s"><testcase classname="a.B" name="test_a">'
+        '<failure>&e;</failure></testcase></testsuite>'
+    ).format(secret.strpath).encode('utf-8')
+    for parse in (xunitparser.parse, xunitparser.iterparse):
+        with pytest.raises(SyntaxError):
+            list(parse(io.BytesIO(source), backend=backend))
+
+
+def test_iterparse_is_lazy():
+    cases = xunitparser.iterparse(io.BytesIO(SUITES))
+    first = next(cases)
+    assert first.methodname == 'test_ok'
+    assert first.classname == 'a.B'
+
+
+def test_result_summary():
+    suite, result = xunitparser.parse(io.BytesIO(SUITES))
+    assert result.testsRun == 3
+    assert [tc.methodname for tc, _ in result.failures] == ['test_fail']
+    assert result.failures[0][1] == 'AssertionError: **Reason:**\nboom\n\ntrace'
+    assert [tc.methodname for tc, _ in result.skipped] == ['test_skip']
+    assert result.errors == []
+    assert not result.wasSuccessful()
+
+
+def test_case_record():
+    tc = xunitparser.TestCase(classname='a.B', methodname='test_a')
+    assert not hasattr(tc, '__dict__')
+    assert tc.success and tc.good
+    assert tc.stdout is None
+    assert tc == xunitparser.TestCase(classname='a.B', methodname='test_a')
+    assert tc.id() == 'a.B.test_a'
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        xunitparser.Parser('sax')
+
+
+def test_auto_backend_fallback(mocker):
+    mocker.patch.object(xunitparser, 'lxml_etree', None)
+    assert xunitparser.Parser().backend == 'etree'
+    with pytest.raises(ImportError):
+        xunitparser.Parser('lxml')
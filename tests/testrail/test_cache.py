@@ -0,0 +1,75 @@
+import os
+import re
+
+import pytest
+
+from xunit2testrail.testrail.cache import ResponseCache
+from xunit2testrail.testrail.client import Item
+
+
+@pytest.fixture
+def cache(client, tmpdir, mocker):
+    cache = ResponseCache(str(tmpdir), namespace=client.base_url)
+    client.cache = cache
+    mocker.patch.object(Item, '_response_cache', cache)
+    return cache
+
+
+def requests_to(api_mock, endpoint):
+    return [r for r in api_mock.request_history if endpoint in r.url]
+
+
+def test_cached_projects(api_mock, client, cache):
+    client.projects()
+    projects = client.projects()
+    assert projects[0].id == 1
+    assert len(requests_to(api_mock, 'get_projects')) == 1
+
+
+def test_cached_find(api_mock, client, cache):
+    project = client.projects.find(id=1)
+    client.projects.find(id=1)
+    project.suites.find(id=2)
+    project.suites.find(id=2)
+    assert len(requests_to(api_mock, 'get_projects')) == 1
+    assert len(requests_to(api_mock, 'get_suites')) == 1
+    assert os.listdir(cache.path)
+
+
+def test_cached_statuses(api_mock, client, cache):
+    assert client.statuses == client.statuses
+    assert len(requests_to(api_mock, 'get_statuses')) == 1
+
+
+def test_expired_entry(api_mock, client, cache):
+    cache.ttls['get_projects'] = -1
+    client.projects()
+    client.projects()
+    assert len(requests_to(api_mock, 'get_projects')) == 2
+
+
+def test_not_cached_endpoint(api_mock, project, cache):
+    project.runs()
+    project.runs()
+    assert len(requests_to(api_mock, 'get_runs')) == 2
+
+
+def test_cases_updated_incrementally(api_mock, client, suite, cache):
+    cases = suite.cases()
+    base = re.escape(client.base_url)
+    api_mock.register_uri(
+        'GET', re.compile(base + r'get_cases/.*updated_after=\d+'),
+        json=[{'id': 3, 'suite_id': 2, 'title': 'new title'},
+              {'id': 32, 'suite_id': 2, 'title': 'case title32'}])
+    updated_cases = suite.cases()
+    assert [c.id for c in updated_cases] == [c.id for c in cases] + [32]
+    assert updated_cases[0].title == 'new title'
+    assert 'updated_after' in api_mock.request_history[-1].url
+
+
+def test_eviction(tmpdir):
+    cache = ResponseCache(str(tmpdir), max_size=1000)
+    for i in range(10):
+        cache.fetch('get_projects', {'i': i}, lambda params: ['x' * 100])
+    size = sum(os.path.getsize(str(f)) for f in tmpdir.listdir())
+    assert 0 < size <= 1000
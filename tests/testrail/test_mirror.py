@@ -0,0 +1,62 @@
+import re
+
+import pytest
+
+from xunit2testrail.testrail.cache import ResponseCache
+from xunit2testrail.testrail.client import Item
+from xunit2testrail.testrail.mirror import Mirror
+
+
+@pytest.fixture
+def mirror(api_mock, client, tmpdir):
+    base = re.escape(client.base_url)
+    api_mock.register_uri('GET', re.compile(base + r'get_sections/.*'),
+                          json=[{'id': 157, 'name': 'All'}])
+    mirror = Mirror(str(tmpdir.join('mirror.sqlite')))
+    yield mirror
+    mirror.close()
+
+
+def test_full_sync(mirror, suite):
+    mirror.sync_suite(suite)
+    cases = mirror.cases(suite.id)
+    assert [c.id for c in cases] == [c.id for c in suite.cases()]
+    assert mirror.sections(suite.id) == [{'id': 157, 'name': 'All'}]
+
+
+def test_incremental_sync(api_mock, client, mirror, suite):
+    mirror.sync_suite(suite)
+    base = re.escape(client.base_url)
+    api_mock.register_uri(
+        'GET', re.compile(base + r'get_cases/.*updated_after=\d+'),
+        json=[{'id': 31, 'suite_id': 2, 'title': 'new title'},
+              {'id': 32, 'suite_id': 2, 'title': 'case title32'}])
+    mirror.sync_suite(suite)
+    assert 'updated_after' in api_mock.request_history[-1].url
+    cases = mirror.cases(suite.id)
+    assert [c.id for c in cases] == [3, 31, 32]
+    assert cases[1].title == 'new title'
+
+
+def test_full_sync_past_response_cache(api_mock, mirror, suite, tmpdir,
+                                       mocker):
+    cache = ResponseCache(str(tmpdir.join('cache')))
+    mocker.patch.object(Item, '_response_cache', cache)
+    mirror.full_sync_interval = 0
+    mirror.sync_suite(suite)
+    mirror.sync_suite(suite)
+    requests = [r.url for r in api_mock.request_history
+                if 'get_cases' in r.url]
+    assert len(requests) == 2
+    assert not any('updated_after' in url for url in requests)
+
+
+def test_sync_project(mirror, project):
+    mirror.sync_project(project)
+    configs = mirror.configs(project.id)
+    assert configs.find(id=9).project_id == project.id
+
+
+def test_full_sync_interval_matches_cache_ttl(mirror):
+    assert mirror.full_sync_interval == \
+        ResponseCache.default_ttls['get_cases'] == 24 * 3600
@@ -0,0 +1,41 @@
+import threading
+import time
+
+from xunit2testrail.testrail.ratelimit import TokenBucket
+
+
+def test_burst_is_not_throttled():
+    bucket = TokenBucket(rate=60, burst=3)
+    assert all(bucket.acquire() < 0.05 for _ in range(3))
+
+
+def test_rate_is_limited():
+    bucket = TokenBucket(rate=600, burst=1)
+    bucket.acquire()
+    assert 0.05 < bucket.acquire() < 0.5
+
+
+def test_writes_before_reads():
+    bucket = TokenBucket(rate=600, burst=1)
+    bucket.acquire()
+    order = []
+
+    def request(write):
+        bucket.acquire(write=write)
+        order.append(write)
+
+    reader = threading.Thread(target=request, args=(False,))
+    writer = threading.Thread(target=request, args=(True,))
+    writer.start()
+    time.sleep(0.01)
+    reader.start()
+    reader.join()
+    writer.join()
+    assert order == [True, False]
+
+
+def test_client_uses_rate_limiter(client, mocker):
+    client.rate_limiter = TokenBucket(rate=6000)
+    acquire = mocker.spy(client.rate_limiter, 'acquire')
+    client.projects()
+    acquire.assert_called_once_with(write=False)
@@ -0,0 +1,73 @@
+import pytest
+import re
+import requests
+
+from xunit2testrail.testrail.client import Client
+from xunit2testrail.testrail.retry import RetryPolicy
+
+
+@pytest.fixture
+def projects_api(api_mock):
+    def register(responses):
+        url = re.escape('http://testrail/index.php?/api/v2/get_projects')
+        api_mock.register_uri('GET', re.compile(url), responses)
+    return register
+
+
+@pytest.fixture
+def client():
+    return Client(
+        base_url='http://testrail/', username='user', password='password')
+
+
+def test_retry_after_is_honored(client, projects_api, mocker):
+    sleep = mocker.patch('time.sleep')
+    projects_api([{'status_code': 429, 'headers': {'Retry-After': '5'}},
+                  {'status_code': 200, 'json': []}])
+    client.projects()
+    sleep.assert_called_once_with(5)
+    assert client.stats['retries'] == 1
+    assert client.stats['wait_time'] == 5
+
+
+@pytest.mark.parametrize('status', [300, 400, 401, 403, 404])
+def test_fatal_status_is_not_retried(client, projects_api, mocker, status):
+    sleep = mocker.patch('time.sleep')
+    projects_api([{'status_code': status, 'json': {'error': 'error'}},
+                  {'status_code': 200, 'json': []}])
+    with pytest.raises(requests.HTTPError):
+        client.projects()
+    assert not sleep.called
+
+
+def test_connection_error_after_deadline(client, projects_api, mocker):
+    mocker.patch('time.sleep')
+    client.retry_policy.deadline = 0
+    projects_api([{'exc': requests.ConnectionError}])
+    with pytest.raises(requests.ConnectionError):
+        client.projects()
+
+
+def test_post_read_timeout_is_not_retried(client, api_mock, mocker):
+    sleep = mocker.patch('time.sleep')
+    url = re.escape('http://testrail/index.php?/api/v2/add_plan/1')
+    api_mock.register_uri('POST', re.compile(url),
+                          [{'exc': requests.ReadTimeout},
+                           {'status_code': 200, 'json': {}}])
+    with pytest.raises(requests.ReadTimeout):
+        client._query('POST', 'add_plan/1', json={})
+    assert not sleep.called
+
+
+@pytest.mark.parametrize('attempt, max_delay', [(0, 1), (3, 8), (10, 120)])
+def test_backoff_delay(attempt, max_delay):
+    policy = RetryPolicy(backoff_base=1, backoff_max=120)
+    for _ in range(20):
+        assert 0 <= policy.delay(attempt) <= max_delay
+
+
+def test_timeout_fits_deadline():
+    policy = RetryPolicy(connect_timeout=10, read_timeout=300)
+    assert policy.timeout(600) == (10, 300)
+    assert policy.timeout(30) == (10, 30)
+    assert policy.timeout(-5) == (1, 1)
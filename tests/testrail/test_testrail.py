@@ -1,9 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
 import pytest
 import re
 
 from xunit2testrail.testrail.client import Case
 from xunit2testrail.testrail.client import Client
 from xunit2testrail.testrail.client import Config
+from xunit2testrail.testrail.client import Item
 from xunit2testrail.testrail.client import Milestone
 from xunit2testrail.testrail.client import Plan
 from xunit2testrail.testrail.client import Project
@@ -366,3 +370,241 @@ def test_http_errors(api_mock, mocker, statuses):
 
     mocker.patch('time.sleep')
     client.projects()
+
+
+def test_requests_reuse_session(api_mock, client, mocker):
+    request = mocker.spy(client.session, 'request')
+    project = client.projects()[0]
+    project.suites()
+    assert request.call_count == 2
+
+
+def test_client_pool_size():
+    client = Client(base_url='http://testrail/', username='user',
+                    password='password', pool_size=3)
+    adapter = client.session.get_adapter('https://testrail/')
+    assert adapter._pool_maxsize == 3
+
+
+def test_client_context_manager(mocker):
+    with Client(base_url='http://testrail/', username='user',
+                password='password') as client:
+        close = mocker.spy(client.session, 'close')
+    assert close.called
+
+
+@pytest.fixture
+def paged_cases(api_mock, client):
+    cases = [{'id': i, 'suite_id': 2, 'title': 'case {}'.format(i)}
+             for i in range(1, 8)]
+    limit = 2
+
+    def callback(request, context):
+        match = re.search(r'&offset=(\d+)', request.url)
+        offset = int(match.group(1)) if match else 0
+        page = cases[offset:offset + limit]
+        next_url = None
+        if offset + limit < len(cases):
+            next_url = ('/api/v2/get_cases/1&suite_id=2'
+                        '&limit={}&offset={}'.format(limit, offset + limit))
+        return {'offset': offset, 'limit': limit, 'size': len(page),
+                '_links': {'next': next_url, 'prev': None},
+                'cases': page}
+
+    url = re.escape(client.base_url_root) + r'/api/v2/get_cases/.*'
+    api_mock.register_uri('GET', re.compile(url), json=callback)
+    return cases
+
+
+@pytest.mark.parametrize('workers', [1, 3, 10])
+def test_cases_pagination(paged_cases, suite, mocker, workers):
+    mocker.patch.object(Case, '_pagination_workers', workers)
+    cases = suite.cases()
+    assert [c.id for c in cases] == [c['id'] for c in paged_cases]
+
+
+def test_find_stops_on_first_match(api_mock, paged_cases, suite):
+    requests_count = len(api_mock.request_history)
+    case = suite.cases.find(title='case 3')
+    assert case.id == 3
+    assert len(api_mock.request_history) - requests_count == 2
+
+
+def test_find_all_reads_all_pages(paged_cases, suite):
+    cases = suite.cases.find_all(suite_id=2)
+    assert len(cases) == len(paged_cases)
+
+
+def test_find_pass_filters_to_api(api_mock, project):
+    run = project.runs.find(suite_id=2, plan_id=8)
+    assert run.id == 13
+    query = api_mock.request_history[-1].url.split('?', 1)[1]
+    assert 'suite_id=2' in query
+    assert 'plan_id' not in query
+
+
+def test_find_all_with_range_filter(api_mock, project):
+    plans = project.plans.find_all(created_after=100, name='new_test_plan')
+    assert [plan.id for plan in plans] == [8]
+    query = api_mock.request_history[-1].url.split('?', 1)[1]
+    assert 'created_after=100' in query
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_add_results_in_chunks(api_mock, client, mocker, workers):
+    mocker.patch('time.sleep')
+    mocker.patch.object(Item, '_results_chunk_size', 3)
+    mocker.patch.object(Item, '_results_chunk_bytes', 400)
+    mocker.patch.object(Item, '_results_workers', workers)
+    base = re.escape(client.base_url)
+    failed = []
+
+    def add_results(request, context):
+        results = request.json()['results']
+        # Second chunk fails once and is retried alone
+        if results[0]['case_id'] == 3 and not failed:
+            failed.append(True)
+            context.status_code = 503
+            return {}
+        return [{'id': x['case_id'] * 10, 'status_id': 1} for x in results]
+
+    api_mock.register_uri('POST', re.compile(base + r'add_results_for_cases/4'),
+                          json=add_results)
+    cases = [Case(id=i) for i in range(8)]
+    for case in cases:
+        comment = 'x' * (150 if case.id == 5 else 10)
+        case.add_result(status_id=1, comment=comment)
+    results = Run(id=4).results.add_for_cases(4, cases)
+
+    assert [x.id for x in results] == [i * 10 for i in range(8)]
+    chunks = [[x['case_id'] for x in r.json()['results']]
+              for r in api_mock.request_history]
+    assert sorted(chunks) == [[0, 1, 2], [3, 4], [3, 4], [5, 6], [7]]
+
+
+@pytest.mark.parametrize('threshold, compressed', [
+    (None, False),
+    (10 ** 6, False),
+    (100, True),
+])
+def test_compressed_request_body(api_mock, client, threshold, compressed):
+    client.compress_threshold = threshold
+    base = re.escape(client.base_url)
+    api_mock.register_uri('POST', re.compile(base + r'add_case/.*'),
+                          json={'id': 1})
+    data = {'title': 'case ' * 100}
+    client._query('POST', 'add_case/1', json=data)
+
+    request = api_mock.request_history[-1]
+    body = request.body
+    if compressed:
+        assert request.headers['Content-Encoding'] == 'gzip'
+        body = gzip.decompress(body)
+    else:
+        assert 'Content-Encoding' not in request.headers
+    assert json.loads(body.decode('utf-8')) == data
+    assert client.stats['bytes_sent'] == len(request.body)
+    assert client.stats['bytes_received'] == len(b'{"id": 1}')
+
+
+def test_accept_encoding(api_mock, client):
+    client.projects()
+    assert 'gzip' in api_mock.request_history[-1].headers['Accept-Encoding']
+
+
+def test_add_only_changed_results(api_mock, client):
+    base = re.escape(client.base_url)
+    api_mock.register_uri(
+        'GET', re.compile(base + r'get_tests/4'),
+        json=[{'id': 100 + i, 'case_id': i} for i in range(1, 5)])
+    # Newer results have greater ids, order of API response doesn't matter
+    api_mock.register_uri(
+        'GET', re.compile(base + r'get_results_for_run/4'),
+        json=[{'id': 1, 'test_id': 101, 'status_id': 5},
+              {'id': 3, 'test_id': 101, 'status_id': 1},
+              {'id': 2, 'test_id': 102, 'status_id': 1},
+              {'id': 4, 'test_id': 103, 'status_id': 1}])
+    api_mock.register_uri(
+        'POST', re.compile(base + r'add_results_for_cases/4'),
+        json=lambda request, context: request.json()['results'])
+
+    cases = [Case(id=i) for i in range(1, 6)]
+    for case, status_id in zip(cases, [1, 5, 1, 1]):
+        case.add_result(status_id=status_id)
+    run = Run(id=4, include_all=True)
+    results = run.add_results_for_cases(cases, only_changed=True)
+    assert [x.case_id for x in results] == [2, 4]
+
+    cases[1].result.status_id = 1
+    cases[3].result = None
+    assert run.add_results_for_cases(cases, only_changed=True) == []
+
+
+def test_add_results_reuses_known_cases_and_plan(api_mock, client, plan):
+    base = re.escape(client.base_url)
+    api_mock.register_uri(
+        'POST', re.compile(base + r'update_plan_entry/8/12'),
+        json={'id': 12})
+    api_mock.register_uri(
+        'POST', re.compile(base + r'add_results_for_cases/13'), json=[])
+    api_mock.reset_mock()
+    run = Run(id=13, plan_id=8, name='some test run', description=None,
+              assignedto_id=None)
+    cases = [Case(id=i) for i in (1, 2, 3, 3)]
+    for case in cases:
+        case.add_result(status_id=1)
+
+    run.add_results_for_cases(cases, case_ids=[1], plan=plan)
+
+    urls = [r.url.split('/api/v2/')[-1] for r in api_mock.request_history]
+    assert urls == ['update_plan_entry/8/12', 'add_results_for_cases/13']
+    assert api_mock.request_history[0].json()['case_ids'] == [1, 2, 3]
+
+
+def test_add_results_without_missing_cases(api_mock, client):
+    base = re.escape(client.base_url)
+    api_mock.register_uri(
+        'POST', re.compile(base + r'add_results_for_cases/4'), json=[])
+    api_mock.reset_mock()
+    cases = [Case(id=i) for i in (1, 2)]
+    for case in cases:
+        case.add_result(status_id=1)
+
+    Run(id=4).add_results_for_cases(cases, case_ids=[2, 1])
+
+    assert api_mock.call_count == 1
+
+
+def plan_with_runs():
+    runs = [{'id': 4, 'name': 'other run', 'suite_id': 2, 'config_ids': [9]},
+            {'id': 13, 'name': 'some test run', 'suite_id': 2,
+             'config_ids': [9]}]
+    return Plan(id=8, name='new_test_plan',
+                entries=[{'id': 12, 'suite_id': 2, 'runs': runs}])
+
+
+def test_find_run_requests_matched_run_only(api_mock, client):
+    plan = plan_with_runs()
+    api_mock.reset_mock()
+
+    run = plan.find_run(name='some test run', suite_id=2, config_ids=[9])
+
+    assert run.id == 13
+    assert [r.url.split('/api/v2/')[-1]
+            for r in api_mock.request_history] == ['get_run/13']
+    with pytest.raises(NotFound):
+        plan.find_run(name='some test run', suite_id=2, config_ids=[])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_plan_runs_order(api_mock, client, mocker, workers):
+    mocker.patch.object(Item, '_pagination_workers', workers)
+    assert [run.id for run in plan_with_runs().runs] == [4, 13]
+
+
+def test_stats_counted_from_threads(api_mock, client):
+    requests_count = client.stats['requests']
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: client._query('GET', 'get_statuses'),
+                          range(100)))
+    assert client.stats['requests'] - requests_count == 100
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import functools
+import glob
+import itertools
 import json
 import logging
 import os
@@ -14,6 +17,7 @@ import prettytable
 
 from xunit2testrail import TemplateCaseMapper
 from xunit2testrail import Reporter
+from xunit2testrail.vendor import xunitparser
 
 warnings.simplefilter('always', DeprecationWarning)
 logger = logging.getLogger(__name__)
@@ -34,12 +38,41 @@ def filename(string):
     return string
 
 
+def report_path(string):
+    if os.path.isdir(string) or glob.has_magic(string):
+        return string
+    return filename(string)
+
+
+def positive_int(string):
+    value = int(string)
+    if value < 1:
+        msg = "%r is not a positive number" % string
+        raise argparse.ArgumentTypeError(msg)
+    return value
+
+
 def parse_args(args):
     defaults = {
         'TESTRAIL_URL': 'https://mirantis.testrail.com',
         'TESTRAIL_USER': 'user@example.com',
         'TESTRAIL_PASSWORD': 'password',
         'TESTRAIL_REQUEST_TIMEOUT': 3200,
+        'TESTRAIL_CONNECT_TIMEOUT': 10,
+        'TESTRAIL_READ_TIMEOUT': 300,
+        'TESTRAIL_POOL_SIZE': 10,
+        'TESTRAIL_RATE_LIMIT': None,
+        'TESTRAIL_RATE_BURST': None,
+        'TESTRAIL_PAGINATION_WORKERS': 4,
+        'TESTRAIL_CACHE_DIR': None,
+        'TESTRAIL_CACHE_TTL': {},
+        'TESTRAIL_CACHE_SIZE': 512,
+        'TESTRAIL_MIRROR': None,
+        'TESTRAIL_MIRROR_FULL_SYNC': 24,
+        'TESTRAIL_RESULTS_CHUNK_SIZE': 500,
+        'TESTRAIL_RESULTS_CHUNK_SIZE_MB': 4,
+        'TESTRAIL_RESULTS_WORKERS': 4,
+        'TESTRAIL_COMPRESS_THRESHOLD': None,
         'TESTRAIL_PROJECT': 'Mirantis OpenStack',
         'TESTRAIL_MILESTONE': '9.0',
         'TESTRAIL_TEST_SUITE': '[{0.testrail_milestone}] MOSQA',
@@ -48,6 +81,9 @@ def parse_args(args):
         'TESTRAIL_CONFIGURATION_NAME': None,
         'TESTRAIL_CASE_MAX_NAME_LENGHT': 0,
         'XUNIT_REPORT': 'report.xml',
+        'XUNIT_PARSER': 'auto',
+        'XUNIT_WORKERS': None,
+        'XUNIT_CACHE_DIR': None,
         'XUNIT_NAME_TEMPLATE': '{id}',
         'TESTRAIL_NAME_TEMPLATE': '{custom_report_label}',
         'TESTRAIL_RUN_DESCRIPTION': None,
@@ -56,16 +92,45 @@ def parse_args(args):
         'ENV_DESCRIPTION': '',
         'TEST_RESULTS_LINK': '',
         'PASTE_BASE_URL': None,
+        'PASTE_TIMEOUT': 60,
+        'PASTE_RETRIES': 3,
+        'PASTE_CACHE': None,
+        'RESULT_WORKERS': 8,
     }
     defaults = {k: os.environ.get(k, v) for k, v in defaults.items()}
 
     parser = argparse.ArgumentParser(description='xUnit to testrail reporter')
     parser.add_argument(
         'xunit_report',
-        type=filename,
+        type=report_path,
+        nargs='+',
         default=defaults['XUNIT_REPORT'],
-        help='xUnit report XML file')
+        help=('xUnit report XML files, directories with them or glob patterns. '
+              'Cases of several reports are merged in the order of file paths. '
+              'Reports may be compressed with gzip, xz or zstd'))
 
+    parser.add_argument(
+        '--xunit-parser',
+        choices=xunitparser.BACKENDS,
+        default=defaults['XUNIT_PARSER'],
+        help='XML library to parse xUnit report, "auto" uses lxml if installed')
+    parser.add_argument(
+        '--xunit-workers',
+        type=positive_int,
+        default=defaults['XUNIT_WORKERS'],
+        help='Number of processes to parse several xUnit reports, number of CPUs by default')
+    parser.add_argument(
+        '--xunit-lazy-payloads',
+        action='store_true',
+        default=False,
+        help=('Read stdout, stderr and trace of cases from xUnit report only when '
+              'they are sent (for failed cases). Reduces memory used for large reports'))
+    parser.add_argument(
+        '--xunit-cache-dir',
+        type=str_cls,
+        default=defaults['XUNIT_CACHE_DIR'],
+        help=('Directory to cache parsed xUnit reports, so an unchanged report '
+              'is not parsed again on the next run. Disabled by default'))
     parser.add_argument(
         '--xunit-name-template',
         type=str_cls,
@@ -121,7 +186,92 @@ def parse_args(args):
         default=defaults['TESTRAIL_REQUEST_TIMEOUT'],
         help=('Timeout of waiting for a passed request to TestRail (HTTP status code < 300). '
               'Covers cases like HTTP-429 "API Rate Limit" or HTTP-409 "maintenance". '
-              'During this period, the request will be repeated with random intervals (from 300 to 600 sec)'))
+              'During this period, the request will be repeated after the delay from '
+              'the "Retry-After" header or with exponential backoff'))
+    parser.add_argument(
+        '--testrail-connect-timeout',
+        type=float,
+        default=defaults['TESTRAIL_CONNECT_TIMEOUT'],
+        help='Timeout (sec) of connecting to TestRail for a single try')
+    parser.add_argument(
+        '--testrail-read-timeout',
+        type=float,
+        default=defaults['TESTRAIL_READ_TIMEOUT'],
+        help='Timeout (sec) of waiting for TestRail response for a single try')
+    parser.add_argument(
+        '--testrail-pool-size',
+        type=int,
+        default=defaults['TESTRAIL_POOL_SIZE'],
+        help='Number of keep-alive connections to TestRail kept for reuse')
+    parser.add_argument(
+        '--testrail-rate-limit',
+        type=int,
+        default=defaults['TESTRAIL_RATE_LIMIT'],
+        help=('Max number of requests to TestRail per minute. Writes are made '
+              'before reads if the limit is reached. Unlimited by default'))
+    parser.add_argument(
+        '--testrail-rate-burst',
+        type=int,
+        default=defaults['TESTRAIL_RATE_BURST'],
+        help='Max number of requests to TestRail made at once under the rate limit')
+    parser.add_argument(
+        '--testrail-pagination-workers',
+        type=int,
+        default=defaults['TESTRAIL_PAGINATION_WORKERS'],
+        help='Number of list pages (e.g. of cases) fetched from TestRail concurrently')
+    parser.add_argument(
+        '--testrail-cache-dir',
+        type=str_cls,
+        default=defaults['TESTRAIL_CACHE_DIR'],
+        help=('Directory to cache TestRail projects, suites, cases, statuses, '
+              'configs and milestones between runs. Disabled by default'))
+    parser.add_argument(
+        '--testrail-cache-ttl',
+        type=json.loads,
+        default=defaults['TESTRAIL_CACHE_TTL'],
+        help=('TTL in seconds for cached TestRail API calls in JSON format '
+              '{"get_cases": 86400}. Cached cases are updated on each run and '
+              'fully re-fetched after TTL'))
+    parser.add_argument(
+        '--testrail-cache-size',
+        type=int,
+        default=defaults['TESTRAIL_CACHE_SIZE'],
+        help='Max size of TestRail cache directory in MB')
+    parser.add_argument(
+        '--testrail-mirror',
+        type=str_cls,
+        default=defaults['TESTRAIL_MIRROR'],
+        help=('SQLite file to keep a local copy of the TestRail suite. '
+              'Only changed cases are fetched from TestRail on each run'))
+    parser.add_argument(
+        '--testrail-mirror-full-sync',
+        type=float,
+        default=defaults['TESTRAIL_MIRROR_FULL_SYNC'],
+        help=('Interval in hours between full syncs of the TestRail mirror. '
+              'Cases deleted in TestRail are kept in the mirror and may be '
+              'matched until the next full sync'))
+    parser.add_argument(
+        '--testrail-results-chunk-size',
+        type=int,
+        default=defaults['TESTRAIL_RESULTS_CHUNK_SIZE'],
+        help='Max number of results sent to TestRail in a single request')
+    parser.add_argument(
+        '--testrail-results-chunk-size-mb',
+        type=float,
+        default=defaults['TESTRAIL_RESULTS_CHUNK_SIZE_MB'],
+        help='Max size (MB) of results sent to TestRail in a single request')
+    parser.add_argument(
+        '--testrail-results-workers',
+        type=int,
+        default=defaults['TESTRAIL_RESULTS_WORKERS'],
+        help='Number of requests with results sent to TestRail concurrently')
+    parser.add_argument(
+        '--testrail-compress-threshold',
+        type=int,
+        default=defaults['TESTRAIL_COMPRESS_THRESHOLD'],
+        help=('Send request bodies larger than this number of bytes to TestRail '
+              'gzipped. Server (or proxy) should accept "Content-Encoding: gzip". '
+              'Disabled by default'))
     parser.add_argument(
         '--testrail-project',
         type=str_cls,
@@ -180,12 +330,40 @@ def parse_args(args):
         default=defaults['PASTE_BASE_URL'],
         help=('pastebin service JSON API URL to send test case logs and trace,'
               ' example: http://localhost:5000/'))
+    parser.add_argument(
+        '--paste-timeout',
+        type=float,
+        default=defaults['PASTE_TIMEOUT'],
+        help='Timeout (sec) of connecting and waiting for pastebin service response')
+    parser.add_argument(
+        '--paste-retries',
+        type=int,
+        default=defaults['PASTE_RETRIES'],
+        help='Number of retries of failed uploads to pastebin service')
+    parser.add_argument(
+        '--paste-cache',
+        type=str_cls,
+        default=defaults['PASTE_CACHE'],
+        help=('JSON file to keep URLs of uploaded pastes between runs. Equal '
+              'pastes are uploaded once per run anyway'))
+    parser.add_argument(
+        '--result-workers',
+        type=int,
+        default=defaults['RESULT_WORKERS'],
+        help='Number of threads to prepare results (comments and pastes) of cases')
     parser.add_argument(
         '--testrail-run-update',
         dest='use_test_run_if_exists',
         action='store_true',
         default=False,
         help='don\'t create new test run if such already exists')
+    parser.add_argument(
+        '--testrail-delta-results',
+        dest='delta_results',
+        action='store_true',
+        default=False,
+        help=('Send only results which status differs from the latest result of '
+              'the case in the run (or the case has no result yet)'))
     parser.add_argument(
         '--testrail-run-description',
         type=str_cls,
@@ -250,7 +428,15 @@ def main(args=None):
         env_description=args.env_description,
         test_results_link=args.test_results_link,
         case_mapper=case_mapper,
-        paste_url=args.paste_url)
+        paste_url=args.paste_url,
+        xunit_parser=args.xunit_parser,
+        xunit_workers=args.xunit_workers,
+        xunit_lazy_payloads=args.xunit_lazy_payloads,
+        xunit_cache_dir=args.xunit_cache_dir,
+        result_workers=args.result_workers,
+        paste_timeout=args.paste_timeout,
+        paste_retries=args.paste_retries,
+        paste_cache=args.paste_cache)
     suite = args.testrail_suite.format(args)
     reporter.config_testrail(
         base_url=args.testrail_url,
@@ -268,10 +454,41 @@ def main(args=None):
         testrail_case_section_name=args.testrail_case_section_name,
         testrail_configuration_name=args.testrail_configuration_name,
         dry_run=args.dry_run,
-        request_timeout=args.testrail_request_timeout)
+        delta_results=args.delta_results,
+        request_timeout=args.testrail_request_timeout,
+        pool_size=args.testrail_pool_size,
+        connect_timeout=args.testrail_connect_timeout,
+        read_timeout=args.testrail_read_timeout,
+        rate_limit=args.testrail_rate_limit,
+        rate_burst=args.testrail_rate_burst,
+        pagination_workers=args.testrail_pagination_workers,
+        cache_dir=args.testrail_cache_dir,
+        cache_ttls=args.testrail_cache_ttl,
+        cache_max_size=args.testrail_cache_size * 1024 * 1024,
+        mirror_path=args.testrail_mirror,
+        mirror_full_sync_interval=args.testrail_mirror_full_sync * 3600,
+        results_chunk_size=args.testrail_results_chunk_size,
+        results_chunk_bytes=int(args.testrail_results_chunk_size_mb * 1024 * 1024),
+        results_workers=args.testrail_results_workers,
+        compress_threshold=args.testrail_compress_threshold)
+
+    with reporter:
+        report(reporter, args)
+
 
-    xunit_suite, _ = reporter.get_xunit_test_suite()
-    mapping = reporter.map_cases(xunit_suite)
+def report(reporter, args):
+    # TestRail lookups are done while the reports are parsed, cases are
+    # buffered only until the lookups are finished
+    xunit_cases = reporter.iter_xunit_cases()
+    parsed = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        warm_up = executor.submit(reporter.warm_up)
+        for xunit_case in xunit_cases:
+            parsed.append(xunit_case)
+            if warm_up.done():
+                break
+        warm_up.result()
+    mapping = reporter.map_cases(itertools.chain(parsed, xunit_cases))
     if not args.dry_run:
         cases = reporter.fill_case_results(mapping)
         if len(cases) == 0:
@@ -281,7 +498,7 @@ def main(args=None):
         run_description = args.testrail_run_description
         test_run = reporter.get_or_create_test_run(plan, cases,
                                                    run_description)
-        test_run.add_results_for_cases(cases)
+        reporter.add_results(test_run, cases, plan)
         reporter.print_run_url(test_run)
     else:
         print_mapping_table(mapping)
@@ -1,21 +1,33 @@
 from __future__ import absolute_import, print_function
 
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+import hashlib
+import json
 import logging
+import os
 import re
+import threading
 from six.moves.urllib import parse
 
 from jinja2 import Environment, PackageLoader
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .testrail import Client as TrClient
 from .testrail.client import Run
 from .testrail.exceptions import NotFound
-from .vendor import xunitparser
+from .testrail.mirror import Mirror
+from .utils import atomic_write
 from .utils import truncate_head
+from . import xunit
 
 logger = logging.getLogger(__name__)
 
+JENKINS_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
 
 def memoize(f):
     @wraps(f)
@@ -23,7 +35,13 @@ def memoize(f):
         key = f.__name__
         cached = self._cache.get(key)
         if cached is None:
-            cached = self._cache[key] = f(self, *args, **kwargs)
+            # Concurrent callers wait for the first one to finish
+            with self._cache_lock:
+                lock = self._cache_locks.setdefault(key, threading.Lock())
+            with lock:
+                cached = self._cache.get(key)
+                if cached is None:
+                    cached = self._cache[key] = f(self, *args, **kwargs)
         return cached
 
     return wrapper
@@ -31,14 +49,32 @@ def memoize(f):
 
 class Reporter(object):
     def __init__(self, xunit_report, env_description, test_results_link,
-                 case_mapper, paste_url, *args, **kwargs):
+                 case_mapper, paste_url, *args, xunit_parser='auto',
+                 xunit_workers=None, xunit_lazy_payloads=False,
+                 xunit_cache_dir=None, result_workers=8, paste_timeout=60,
+                 paste_retries=3, paste_cache=None, **kwargs):
+        self.mirror = None
         self._config = {}
         self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._cache_locks = {}
         self.xunit_report = xunit_report
         self.env_description = env_description
         self.test_results_link = test_results_link
         self.case_mapper = case_mapper
         self.paste_url = paste_url
+        self.xunit_parser = xunit_parser
+        self.xunit_workers = xunit_workers
+        self.xunit_lazy_payloads = xunit_lazy_payloads
+        self.xunit_cache_dir = xunit_cache_dir
+        self.result_workers = result_workers
+        self.paste_timeout = paste_timeout
+        self.paste_retries = paste_retries
+        self.paste_cache = paste_cache
+        self._pastes = None
+        self._pastes_lock = threading.Lock()
+        # Case ids of runs created by the reporter
+        self._created_runs = {}
         self.env = Environment(loader=PackageLoader('xunit2testrail'))
 
         super(Reporter, self).__init__(*args, **kwargs)
@@ -48,11 +84,35 @@ class Reporter(object):
                         use_test_run_if_exists=False, send_duplicates=False,
                         testrail_add_missing_cases=False, testrail_case_custom_fields=None,
                         testrail_case_section_name=None, testrail_configuration_name=None,
-                        dry_run=False, request_timeout=600):
+                        dry_run=False, delta_results=False,
+                        request_timeout=600, pool_size=10,
+                        connect_timeout=10, read_timeout=300,
+                        rate_limit=None, rate_burst=None,
+                        pagination_workers=1, cache_dir=None,
+                        cache_ttls=None,
+                        cache_max_size=512 * 1024 * 1024,
+                        mirror_path=None,
+                        mirror_full_sync_interval=24 * 3600,
+                        results_chunk_size=500,
+                        results_chunk_bytes=4 * 1024 * 1024,
+                        results_workers=1, compress_threshold=None):
         self._config['testrail'] = dict(base_url=base_url,
                                         username=username,
                                         password=password,
-                                        request_timeout=request_timeout)
+                                        request_timeout=request_timeout,
+                                        pool_size=pool_size,
+                                        connect_timeout=connect_timeout,
+                                        read_timeout=read_timeout,
+                                        rate_limit=rate_limit,
+                                        rate_burst=rate_burst,
+                                        pagination_workers=pagination_workers,
+                                        cache_dir=cache_dir,
+                                        cache_ttls=cache_ttls,
+                                        cache_max_size=cache_max_size,
+                                        results_chunk_size=results_chunk_size,
+                                        results_chunk_bytes=results_chunk_bytes,
+                                        results_workers=results_workers,
+                                        compress_threshold=compress_threshold)
         self.milestone_name = milestone
         self.project_name = project
         self.tests_suite_name = tests_suite
@@ -67,11 +127,65 @@ class Reporter(object):
         self.testrail_case_section_name = testrail_case_section_name
         self.testrail_configuration_name = testrail_configuration_name
         self.dry_run = dry_run
+        self.delta_results = delta_results
+        self.mirror = None
+        if mirror_path:
+            self.mirror = Mirror(mirror_path,
+                                 full_sync_interval=mirror_full_sync_interval)
+
+    @property
+    def test_results_link(self):
+        return self._test_results_link
+
+    @test_results_link.setter
+    def test_results_link(self, value):
+        self._test_results_link = value
+        self._jenkins_report_prefix = '{}testReport/'.format(value)
 
     @property
+    @memoize
+    def comment_template(self):
+        return self.env.get_template('testrail_comment.md')
+
+    @property
+    @memoize
     def testrail_client(self):
         return TrClient(**self._config['testrail'])
 
+    @property
+    @memoize
+    def paste_session(self):
+        """Session with a connection per result worker to paste service"""
+        session = requests.Session()
+        retry = Retry(total=self.paste_retries,
+                      backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset(['POST']))
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=self.result_workers,
+                              max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def close(self):
+        """Close connections opened to TestRail and paste service"""
+        client = self._cache.pop('testrail_client', None)
+        if client is not None:
+            client.close()
+        paste_session = self._cache.pop('paste_session', None)
+        if paste_session is not None:
+            paste_session.close()
+        self.save_pastes()
+        if self.mirror is not None:
+            self.mirror.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     @property
     @memoize
     def project(self):
@@ -95,41 +209,115 @@ class Reporter(object):
     @property
     @memoize
     def cases(self):
-        return self.suite.cases()
+        if self.mirror is None:
+            return self.suite.cases()
+        self.sync_mirror()
+        return self.mirror.cases(self.suite.id)
+
+    @memoize
+    def sync_mirror(self):
+        """Update local copy of the project and the suite"""
+        self.mirror.sync_project(self.project)
+        self.mirror.sync_suite(self.suite)
+        return True
 
     @property
     @memoize
     def testrail_statuses(self):
         return self.testrail_client.statuses
 
-    def get_or_create_plan(self):
-        """Get exists or create new TestRail Plan"""
+    @property
+    @memoize
+    def testrail_status_ids(self):
+        """Ids of statuses by name, the first status with a name wins"""
+        status_ids = {}
+        for status_id, name in self.testrail_statuses.items():
+            status_ids.setdefault(name, status_id)
+        return status_ids
+
+    @memoize
+    def find_plan(self):
+        """Plan named `plan_name`, False if there is no such plan"""
         try:
-            plan = self.project.plans.find(name=self.plan_name)
+            return self.project.plans.find(name=self.plan_name)
         except NotFound:
+            return False
+
+    def get_or_create_plan(self):
+        """Get exists or create new TestRail Plan"""
+        plan = self.find_plan()
+        if not plan:
             plan = self.project.plans.add(name=self.plan_name,
                                           description=self.plan_description,
                                           milestone_id=self.milestone.id)
+            self._cache['find_plan'] = plan
             logger.debug('Created new plan "{}"'.format(self.plan_name))
         else:
             logger.debug('Found plan "{}"'.format(self.plan_name))
         return plan
 
+    def warm_up(self):
+        """Resolve TestRail objects used by the report concurrently
+
+        Lookups which need only the project are started together once it
+        is found, so warm-up takes about as long as the longest chain of
+        requests. Nothing is created in TestRail.
+        """
+        lookups = [lambda: self.milestone, lambda: self.cases]
+        if not self.dry_run:
+            lookups.append(self.find_plan)
+            if self.testrail_configuration_name:
+                lookups.append(lambda: self.testrail_configuration)
+        with ThreadPoolExecutor(len(lookups) + 1) as executor:
+            futures = []
+            if not self.dry_run:
+                futures.append(executor.submit(
+                    lambda: self.testrail_status_ids))
+            self.project
+            futures.extend(executor.submit(lookup) for lookup in lookups)
+            for future in futures:
+                future.result()
+
+    @property
+    @memoize
+    def xunit_reports(self):
+        """Report files found by `xunit_report` files, dirs or globs"""
+        return xunit.find_reports(self.xunit_report)
+
     def get_xunit_test_suite(self):
-        with open(self.xunit_report) as f:
-            ts, tr = xunitparser.parse(f)
-            return ts, tr
+        ts, tr = xunit.parse_reports(
+            self.xunit_reports,
+            backend=self.xunit_parser,
+            workers=self.xunit_workers,
+            lazy_payloads=self.xunit_lazy_payloads,
+            cache_dir=self.xunit_cache_dir)
+        return ts, tr
+
+    def iter_xunit_cases(self):
+        """Yield xUnit cases while the reports are parsed"""
+        return xunit.iter_cases(self.xunit_reports, backend=self.xunit_parser,
+                                workers=self.xunit_workers,
+                                lazy_payloads=self.xunit_lazy_payloads,
+                                cache_dir=self.xunit_cache_dir)
 
     def get_config(self, name):
+        if self.mirror is not None:
+            self.sync_mirror()
+            return self.mirror.configs(self.project.id).find(name=name)
         return self.project.configs.find(name=name)
 
+    @property
+    @memoize
+    def testrail_configuration(self):
+        return self.get_config(self.testrail_configuration_name)
+
     def get_jenkins_report_url(self, xunit_case):
         module, _, classname = xunit_case.classname.rpartition('.')
         if module == '':
             module = '(root)'
-        methodname = re.sub(r'[^a-zA-Z0-9_]', '_', xunit_case.methodname)
-        return '{job}testReport/{module}/{classname}/{methodname}/'.format(
-            job=self.test_results_link,
+        methodname = JENKINS_NAME_RE.sub('_', xunit_case.methodname)
+        return '{prefix}{module}/{classname}/{methodname}/'.format(
+            prefix=self._jenkins_report_prefix,
             module=module,
             classname=classname,
             methodname=methodname)
@@ -163,32 +351,106 @@ class Reporter(object):
         if stderr:
             code += '\n' + stderr
 
-        r = requests.post(
-            parse.urljoin(self.paste_url, '/json/?method=pastes.newPaste'),
-            json={
-                'language': 'multi',
-                'code': code
-            })
-        paste_id = r.json().get('data')
+        return self.upload_paste(code)
+
+    def _load_pastes(self):
+        pastes = {}
+        if not self.paste_cache or not os.path.exists(self.paste_cache):
+            return pastes
+        # Broken cache is ignored and replaced on close
+        try:
+            with open(self.paste_cache) as f:
+                urls = json.load(f)
+        except (IOError, ValueError) as e:
+            logger.warning("Can't load paste cache {}: {}".format(
+                self.paste_cache, e))
+            return pastes
+        if not isinstance(urls, dict):
+            logger.warning("Paste cache {} is not a JSON object".format(
+                self.paste_cache))
+            return pastes
+        for digest, url in urls.items():
+            pastes[digest] = Future()
+            pastes[digest].set_result(url)
+        return pastes
+
+    def save_pastes(self):
+        """Store URLs of uploaded pastes to `paste_cache` file"""
+        if not self.paste_cache or self._pastes is None:
+            return
+        with self._pastes_lock:
+            # Failed uploads are not kept, so done futures have results
+            urls = {digest: future.result()
+                    for digest, future in self._pastes.items()
+                    if future.done() and future.result()}
+        with atomic_write(self.paste_cache) as f:
+            json.dump(urls, f)
+
+    def upload_paste(self, code):
+        """Upload paste and return its URL.
+
+        Each distinct paste is uploaded once, others get URL of the first
+        upload (waiting for it if it is in progress).
+        """
+        key = '{}\n{}'.format(self.paste_url, code).encode('utf-8')
+        digest = hashlib.sha256(key).hexdigest()
+        with self._pastes_lock:
+            if self._pastes is None:
+                self._pastes = self._load_pastes()
+            future = self._pastes.get(digest)
+            uploading = future is None
+            if uploading:
+                future = self._pastes[digest] = Future()
+        if not uploading:
+            # Wait without the lock, the upload needs it to finish
+            logger.debug('Reuse paste {}'.format(digest))
+            return future.result()
+        try:
+            r = self.paste_session.post(
+                parse.urljoin(self.paste_url, '/json/?method=pastes.newPaste'),
+                json={
+                    'language': 'multi',
+                    'code': code
+                },
+                timeout=self.paste_timeout)
+            paste_id = r.json().get('data')
+        except Exception as e:
+            # Next cases with the same paste will try to upload it again
+            with self._pastes_lock:
+                del self._pastes[digest]
+            future.set_exception(e)
+            raise
+        url = None
         if paste_id:
-            return parse.urljoin(self.paste_url, '/show/{}/'.format(paste_id))
+            url = parse.urljoin(self.paste_url, '/show/{}/'.format(paste_id))
+        future.set_result(url)
+        return url
+
+    def get_paste_url(self, xunit_case):
+        """Upload logs of not passed case, errors are only logged"""
+        if xunit_case.success or not self.paste_url:
+            return None
+        try:
+            return self.save_to_paste(xunit_case)
+        except Exception as e:
+            logger.warning(e)
 
     def gen_testrail_comment(self, xunit_case):
-        template = self.env.get_template('testrail_comment.md')
-        jenkins_url = self.get_jenkins_report_url(xunit_case)
-        paste_url = None
-        if not xunit_case.success and self.paste_url:
-            try:
-                paste_url = self.save_to_paste(xunit_case)
-            except Exception as e:
-                logger.warning(e)
-
-        return template.render(xunit_case=xunit_case,
-                               env_description=self.env_description,
-                               jenkins_url=jenkins_url,
-                               paste_url=paste_url)
-
-    def add_result_to_case(self, testrail_case, xunit_case):
+        return self.gen_testrail_comments([xunit_case])[0]
+
+    def gen_testrail_comments(self, xunit_cases, paste_urls=None):
+        """Render comments of all cases with the same template"""
+        if paste_urls is None:
+            paste_urls = [self.get_paste_url(x) for x in xunit_cases]
+        render = self.comment_template.render
+        return [render(xunit_case=xunit_case,
+                       env_description=self.env_description,
+                       jenkins_url=self.get_jenkins_report_url(xunit_case),
+                       paste_url=paste_url)
+                for xunit_case, paste_url in zip(xunit_cases, paste_urls)]
+
+    def get_status_id(self, xunit_case):
+        """Return id of TestRail status for case result or None to skip it"""
         if xunit_case.success:
             status_name = 'passed'
         elif xunit_case.failed:
@@ -206,14 +468,20 @@ class Reporter(object):
             logger.warning('Unknown xunit case {} status {}'.format(
                 xunit_case.methodname, xunit_case.result))
             return
-        status_ids = [k for k, v in self.testrail_statuses.items()
-                      if v == status_name]
-        if len(status_ids) == 0:
+        status_id = self.testrail_status_ids.get(status_name)
+        if status_id is None:
             logger.warning("Can't find status {} for result {}".format(
                 status_name, xunit_case.methodname))
+        return status_id
+
+    def add_result_to_case(self, testrail_case, xunit_case):
+        status_id = self.get_status_id(xunit_case)
+        if status_id is None:
             return
-        status_id = status_ids[0]
         comment = self.gen_testrail_comment(xunit_case)
+        return self._add_result(testrail_case, xunit_case, status_id, comment)
+
+    def _add_result(self, testrail_case, xunit_case, status_id, comment):
         elasped = int(xunit_case.time.total_seconds())
         if elasped > 0:
             elasped = "{}s".format(elasped)
@@ -223,7 +491,7 @@ class Reporter(object):
         return testrail_case
 
     def map_cases(self, xunit_suite):
-        cases = self.suite.cases()
+        cases = self.cases
         return self.case_mapper.map(xunit_suite,
                                     cases,
                                     self.suite,
@@ -236,11 +504,29 @@ class Reporter(object):
                                     self.dry_run)
 
     def fill_case_results(self, mapping):
-        filtered_cases = []
+        """Add results to mapped cases.
+
+        Pastes are uploaded in `result_workers` threads, then all comments
+        are rendered at once. Returned cases keep order of `mapping`.
+        """
+        selected = []
         for testrail_case, xunit_case in mapping.items():
-            if self.add_result_to_case(testrail_case, xunit_case):
-                filtered_cases.append(testrail_case)
-        return filtered_cases
+            status_id = self.get_status_id(xunit_case)
+            if status_id is not None:
+                selected.append((testrail_case, xunit_case, status_id))
+        if not selected:
+            return []
+        xunit_cases = [xunit_case for _, xunit_case, _ in selected]
+        if self.paste_url:
+            # Shared session is created before workers start
+            self.paste_session
+        with ThreadPoolExecutor(max(self.result_workers, 1)) as executor:
+            paste_urls = list(executor.map(self.get_paste_url, xunit_cases))
+        comments = self.gen_testrail_comments(xunit_cases, paste_urls)
+        return [self._add_result(testrail_case, xunit_case, status_id,
+                                 comment)
+                for (testrail_case, xunit_case, status_id), comment
+                in zip(selected, comments)]
 
     def create_test_run(self, name, plan, cases,
                         config_ids=None, selected_config=None,
@@ -264,6 +550,7 @@ class Reporter(object):
             plan.add_run(run, selected_config.data)
         else:
             plan.add_run(run)
+        self._created_runs[run.id] = run.case_ids
         return run
 
     def get_or_create_test_run(self, plan, cases, run_description=''):
@@ -277,7 +564,7 @@ class Reporter(object):
         if self.testrail_configuration_name:
             # Tests will be grouped by test suite for different environments
             # described in the testrail_configuration_name parameter
-            selected_config = self.get_config(self.testrail_configuration_name)
+            selected_config = self.testrail_configuration
             if selected_config:
                 config_ids = [config_group['id']
                               for config_group in selected_config.configs
@@ -289,9 +576,9 @@ class Reporter(object):
             try:
                 # If already created with predefined configuration
                 # it will be found here
-                run = plan.runs.find(name=run_name,
-                                     suite_id=self.suite.id,
-                                     config_ids=config_ids)
+                run = plan.find_run(name=run_name,
+                                    suite_id=self.suite.id,
+                                    config_ids=config_ids)
                 logger.debug('Found test run "{}"'.format(run_name))
                 return run
             except NotFound:
@@ -309,5 +596,18 @@ class Reporter(object):
                                     selected_config if create_new_entry else None,
                                     run_description)
 
+    def add_results(self, test_run, cases, plan=None):
+        """Send results of cases to the run.
+
+        A run created by the reporter already has all the cases and no
+        results, so neither its tests nor its results are requested.
+        """
+        case_ids = self._created_runs.get(test_run.id)
+        if case_ids is not None:
+            return test_run.add_results_for_cases(cases, case_ids=case_ids,
+                                                  plan=plan)
+        return test_run.add_results_for_cases(
+            cases, only_changed=self.delta_results, plan=plan)
+
     def print_run_url(self, test_run):
         print('[TestRun URL] {}'.format(test_run.url))
@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import logging
+import os
+import time
+
+from ..utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Margin for difference between local and TestRail clocks, it is
+# subtracted from the time of the last sync in `updated_after` filters
+CLOCK_SKEW = 300
+
+
+class ResponseCache(object):
+    """On-disk cache of slowly changing TestRail GET responses.
+
+    Each response is stored as a JSON file in `path`. Only endpoints listed
+    in `ttls` are cached, an entry older than its endpoint TTL (sec) is
+    fetched again. Entries of `incremental` endpoints are refreshed with
+    `updated_after` filter on each use and fully re-fetched after TTL.
+    When cache size exceeds `max_size` bytes, least recently used entries
+    are removed.
+    """
+
+    default_ttls = {
+        'get_projects': 24 * 3600,
+        'get_suites': 3600,
+        'get_case_fields': 24 * 3600,
+        'get_statuses': 24 * 3600,
+        'get_configs': 3600,
+        'get_milestones': 3600,
+        'get_cases': 24 * 3600,
+    }
+    incremental = frozenset(['get_cases'])
+
+    def __init__(self, path, ttls=None, max_size=512 * 1024 * 1024,
+                 namespace=''):
+        self.path = path
+        self.ttls = dict(self.default_ttls, **(ttls or {}))
+        self.max_size = max_size
+        self.namespace = namespace
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def endpoint(url):
+        return url.lstrip('/').split('/')[0]
+
+    def ttl(self, url):
+        return self.ttls.get(self.endpoint(url))
+
+    def cacheable(self, url, params=None):
+        # Requests for changes are made by callers which track them itself
+        if params and 'updated_after' in params:
+            return False
+        return bool(self.ttl(url))
+
+    def _key(self, url, params):
+        key = json.dumps([self.namespace, url, params or {}], sort_keys=True)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _read(self, key):
+        filename = os.path.join(self.path, key + '.json')
+        try:
+            with open(filename) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        # Mark entry as recently used
+        os.utime(filename, None)
+        return entry
+
+    def _write(self, key, entry):
+        with atomic_write(os.path.join(self.path, key + '.json')) as f:
+            json.dump(entry, f)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            total -= size
+
+    @staticmethod
+    def _merge(items, updated):
+        """Replace changed items by id and append new ones"""
+        positions = {item['id']: i for i, item in enumerate(items)}
+        for item in updated:
+            if item['id'] in positions:
+                items[positions[item['id']]] = item
+            else:
+                positions[item['id']] = len(items)
+                items.append(item)
+        return items
+
+    def fetch(self, url, params, load):
+        """Return cached response or get it with `load(params)`."""
+        endpoint = self.endpoint(url)
+        key = self._key(url, params)
+        started = time.time()
+        entry = self._read(key)
+        if entry is not None and started - entry['stored_at'] < self.ttl(url):
+            if endpoint not in self.incremental:
+                logger.debug('Use cached response for {}'.format(url))
+                return entry['data']
+            delta_params = dict(
+                params or {},
+                updated_after=int(entry['synced_at']) - CLOCK_SKEW)
+            updated = load(delta_params)
+            logger.debug('Update cached response for {} with {} changed '
+                         'items'.format(url, len(updated)))
+            data = self._merge(entry['data'], updated)
+        else:
+            data = load(params)
+            entry = {'stored_at': started}
+        entry['synced_at'] = started
+        entry['data'] = data
+        self._write(key, entry)
+        return data
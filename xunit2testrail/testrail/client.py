@@ -1,17 +1,41 @@
 from __future__ import absolute_import
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import gzip
+import json
 import logging
-import random
+import re
+import threading
 import time
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from .cache import ResponseCache
 from .exceptions import NotFound
+from .ratelimit import TokenBucket
+from .retry import RetryPolicy
 
 logger = logging.getLogger(__name__)
 
 requests_logger = logging.getLogger('requests.packages.urllib3')
 requests_logger.setLevel(logging.WARNING)
 
+_OFFSET_RE = re.compile(r'([&?]offset=)(\d+)')
+# Filters which are applied by API only, items have no such fields
+_RANGE_FILTERS = frozenset(['created_after', 'created_before',
+                            'updated_after', 'updated_before'])
+
+# TODO(ddmitriev): remove 'beta' header after 26 Feb 2021
+# https://blog.gurock.com/announcing-testrail-6-7/
+# https://mirantis.jira.com/browse/PRODX-10103
+_PAGINATION_HEADERS = {'x-api-ident': 'beta'}
+
+
+def _matches(item, conditions):
+    return all(getattr(item, k) == v for k, v in conditions.items())
+
 
 class ItemSet(list):
     def __init__(self, *args, **kwargs):
@@ -19,9 +43,7 @@ class ItemSet(list):
         return super(ItemSet, self).__init__(*args, **kwargs)
 
     def find_all(self, **kwargs):
-        filtered = ItemSet(
-            x for x in self
-            if all(getattr(x, k) == v for k, v in kwargs.items()))
+        filtered = ItemSet(x for x in self if _matches(x, kwargs))
         filtered._item_class = self._item_class
         return filtered
 
@@ -65,29 +87,74 @@ class Collection(object):
     def _to_object(self, data):
         return self._item_class(**data)
 
-    def _list(self, name, params=None):
-        params = params or {}
+    def _get_list_url(self, name):
         url = self._list_url.format(name=name)
         if self.parent_id is not None:
             url += '/{}'.format(self.parent_id)
+        return url
+
+    def _list(self, name, params=None):
+        params = params or {}
+        url = self._get_list_url(name)
         return self._pagination_handler(url=url, name=name, params=params)
 
+    def _server_filters(self, conditions):
+        """Select conditions, which may be passed to API as filters"""
+        params = {}
+        for k, v in conditions.items():
+            if k not in self._item_class._filters:
+                continue
+            if isinstance(v, bool):
+                params[k] = int(v)
+            elif isinstance(v, (int, str)):
+                params[k] = v
+        return params
+
     def _add(self, name, data, **kwargs):
         url = self._add_url.format(name=name)
         if self.parent_id is not None:
             url += '/{}'.format(self.parent_id)
         return self._handler('POST', url, json=data, **kwargs)
 
+    def iter(self, **kwargs):
+        """Iterate over items matched to conditions.
+
+        Pages are requested one by one while iterator is consumed, unless
+        the list is cached, then it is read whole through the cache.
+        Conditions supported by API are also sent as filters, so server
+        returns only suitable items.
+        """
+        name = self._item_class._api_name()
+        url = self._get_list_url(name)
+        params = self._server_filters(kwargs)
+        conditions = {k: v for k, v in kwargs.items()
+                      if k not in params or k not in _RANGE_FILTERS}
+        cache = self._item_class._response_cache
+        if cache is not None and cache.cacheable(url, params):
+            pages = [self._pagination_handler(url=url, name=name,
+                                              params=params)]
+        else:
+            pages = self._item_class._iter_pages(url, name, params=params)
+        for page in pages:
+            for data in page:
+                item = self._to_object(data)
+                if _matches(item, conditions):
+                    yield item
+
     def find_all(self, **kwargs):
-        return self().find_all(**kwargs)
+        items = ItemSet(self.iter(**kwargs))
+        items._item_class = self._item_class
+        return items
 
     def find(self, **kwargs):
-        # if plan is searched perform an additional GET request to API
-        # in order to return full its data including 'entries' field
-        # see http://docs.gurock.com/testrail-api2/reference-plans#get_plans
-        if self._item_class is Plan:
-            return self.get(self().find(**kwargs).id)
-        return self().find(**kwargs)
+        for item in self.iter(**kwargs):
+            # if plan is searched perform an additional GET request to API
+            # in order to return full its data including 'entries' field
+            # see http://docs.gurock.com/testrail-api2/reference-plans#get_plans
+            if self._item_class is Plan:
+                return self.get(item.id)
+            return item
+        raise NotFound(self._item_class, **kwargs)
 
     def get(self, id):
         return self._item_class.get(id)
@@ -106,7 +173,15 @@ class Item(object):
     _get_url = 'get_{name}/{id}'
     _update_url = 'update_{name}/{id}'
     _handler = None
+    _pagination_workers = 1
+    _response_cache = None
+    # Bounds of a single add_results_for_cases request
+    _results_chunk_size = 500
+    _results_chunk_bytes = 4 * 1024 * 1024
+    _results_workers = 1
     _repr_field = 'name'
+    # Fields which can be used to filter list of items by API
+    _filters = frozenset()
 
     def __init__(self, id=None, **kwargs):
         self.id = id
@@ -122,12 +197,17 @@ class Item(object):
         :param name: Name of the key in the response (single),
                      which contains the current portion of list of the objects
         """
+        cache = cls._response_cache
+        if cache is not None and cache.cacheable(url, params):
+            return cache.fetch(url, params,
+                               functools.partial(cls._load_list, url, name))
+        return cls._load_list(url, name, params)
+
+    @classmethod
+    def _load_list(cls, url, name, params=None):
         key_name = f"{name}s"
         params = params or {}
-        # TODO(ddmitriev): remove 'beta' header after 26 Feb 2021
-        # https://blog.gurock.com/announcing-testrail-6-7/
-        # https://mirantis.jira.com/browse/PRODX-10103
-        extra_headers = {'x-api-ident': 'beta'}
+        extra_headers = _PAGINATION_HEADERS
 
         res = cls._handler('GET', url, extra_headers, params=params)
         if type(res) is list:
@@ -140,12 +220,70 @@ class Item(object):
                             f"is not Dict: {res}")
 
         result = res[key_name]
-        while res.get('_links', {}).get('next') is not None:
-            url = res['_links']['next']
-            res = cls._handler('GET', url, extra_headers, params=params)
+        next_url = res.get('_links', {}).get('next')
+        if next_url is None:
+            return result
+        bounded = 'limit' in res and _OFFSET_RE.search(next_url)
+        if bounded and cls._pagination_workers > 1:
+            result.extend(cls._prefetch_pages(next_url, key_name,
+                                              res['limit'], extra_headers,
+                                              params))
+            return result
+        # Serial walk for servers which don't return page bounds
+        while next_url is not None:
+            res = cls._handler('GET', next_url, extra_headers, params=params)
             result.extend(res[key_name])
+            next_url = res.get('_links', {}).get('next')
         return result
 
+    @classmethod
+    def _iter_pages(cls, url, name, params=None):
+        """Yield pages of the list one by one.
+
+        The next page is requested only when the previous one is consumed.
+        """
+        key_name = f"{name}s"
+        while url is not None:
+            res = cls._handler('GET', url, _PAGINATION_HEADERS, params=params)
+            if type(res) is list:
+                # Backward compatibility for unmodified APIs
+                yield res
+                return
+            elif type(res) is not dict:
+                raise Exception(f"Response from pagination api {url} "
+                                f"is not Dict: {res}")
+            elif 'error' in res:
+                raise Exception(res)
+            yield res[key_name]
+            url = res.get('_links', {}).get('next')
+
+    @classmethod
+    def _prefetch_pages(cls, next_url, key_name, limit, extra_headers,
+                        params):
+        """Fetch pages starting from `next_url` concurrently.
+
+        TestRail doesn't return total number of items, so pages are
+        requested in batches of `_pagination_workers` until the page
+        without the next link.
+        """
+        def fetch(url):
+            return cls._handler('GET', url, extra_headers, params=params)
+
+        def page_url(offset):
+            return _OFFSET_RE.sub(r'\g<1>{}'.format(offset), next_url)
+
+        offset = int(_OFFSET_RE.search(next_url).group(2))
+        workers = cls._pagination_workers
+        result = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                urls = [page_url(offset + i * limit) for i in range(workers)]
+                for res in pool.map(fetch, urls):
+                    result.extend(res[key_name])
+                    if res.get('_links', {}).get('next') is None:
+                        return result
+                offset += workers * limit
+
     def __getattr__(self, name):
         if name in self._data:
             return self._data[name]
@@ -250,6 +388,10 @@ class CaseCollection(Collection):
 
 class Case(Item):
     _repr_field = 'title'
+    _filters = frozenset(['section_id', 'milestone_id', 'priority_id',
+                          'template_id', 'type_id', 'created_after',
+                          'created_before', 'created_by', 'updated_after',
+                          'updated_before', 'updated_by'])
 
     def __init__(self, *args, **kwargs):
         super(Case, self).__init__(*args, **kwargs)
@@ -260,6 +402,9 @@ class Case(Item):
 
 
 class Plan(Item):
+    _filters = frozenset(['milestone_id', 'is_completed', 'created_after',
+                          'created_before', 'created_by'])
+
     def __init__(self,
                  name,
                  description=None,
@@ -278,8 +423,41 @@ class Plan(Item):
 
     @property
     def runs(self):
-        return ItemSet([Run.get(id=run['id'])
-                        for entry in self.entries for run in entry['runs']])
+        ids = [run['id'] for entry in self.entries for run in entry['runs']]
+        workers = min(self._pagination_workers, len(ids))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return ItemSet(pool.map(Run.get, ids))
+        return ItemSet([Run.get(id=run_id) for run_id in ids])
+
+    @staticmethod
+    def _run_key(name, suite_id, config_ids):
+        return name, suite_id, tuple(config_ids or ())
+
+    @property
+    def run_index(self):
+        """Ids of plan runs by (name, suite_id, config_ids)
+
+        Built from the entries data, so no run is requested.
+        """
+        index = {}
+        for entry in self.entries:
+            for run in entry['runs']:
+                key = self._run_key(run.get('name'),
+                                    run.get('suite_id', entry.get('suite_id')),
+                                    run.get('config_ids'))
+                index.setdefault(key, run['id'])
+        return index
+
+    def find_run(self, name, suite_id, config_ids=()):
+        """Return the plan run, only the matched one is requested"""
+        key = self._run_key(name, suite_id, config_ids)
+        try:
+            run_id = self.run_index[key]
+        except KeyError:
+            raise NotFound(Run, name=name, suite_id=suite_id,
+                           config_ids=config_ids)
+        return Run.get(id=run_id)
 
     def add_run(self, run, configuration=None):
         url = 'add_plan_entry/{}'.format(self.id)
@@ -314,12 +492,17 @@ class Plan(Item):
         }
 
         result = self._handler('POST', url, json=entry)
+        self.entries.append(result)
         new_run_data = [
-            r for r in result['runs']
+            dict(r) for r in result['runs']
             if set(r['config_ids']) == set(run_data['config_ids'])][0]
         run.id = new_run_data.pop('id')
         run.data.update(new_run_data)
 
+    def has_run(self, run_id):
+        return any(run['id'] == run_id
+                   for entry in self.entries for run in entry['runs'])
+
     def update_run(self, run):
         entry = [_entry
                  for _entry in self.entries for _run in _entry['runs']
@@ -343,6 +526,9 @@ class Plan(Item):
 
 
 class Run(Item):
+    _filters = frozenset(['suite_id', 'milestone_id', 'is_completed',
+                          'created_after', 'created_before', 'created_by'])
+
     def __init__(self,
                  suite_id=None,
                  milestone_id=None,
@@ -371,24 +557,85 @@ class Run(Item):
     def results(self):
         return ResultCollection(Result, parent_id=self.id)
 
-    def add_results_for_cases(self, cases):
+    def latest_results(self, tests=None):
+        """Return the latest result of each case of the run by case id"""
+        if tests is None:
+            tests = self.tests.list()
+        case_ids = {test.id: test.case_id for test in tests}
+        latest = {}
+        for result in self.results.list():
+            case_id = case_ids.get(result.test_id)
+            if case_id is None:
+                continue
+            if case_id not in latest or result.id > latest[case_id].id:
+                latest[case_id] = result
+        return latest
+
+    def changed_cases(self, cases, tests=None):
+        """Select cases without results or with changed status"""
+        latest = self.latest_results(tests)
+        changed = []
+        for case in cases:
+            previous = latest.get(case.id)
+            if case.result is None:
+                continue
+            if previous is None or \
+                    previous.status_id != case.result.status_id:
+                changed.append(case)
+        logger.debug('{} of {} results are changed in run {}'.format(
+            len(changed), len(cases), self.id))
+        return changed
+
+    def add_results_for_cases(self, cases, only_changed=False, case_ids=None,
+                              plan=None):
+        """Send results of cases.
+
+        Cases missing in the run are added to it first. If `case_ids` of
+        the run are known (e.g. it was just created), tests of the run are
+        not requested. `plan` is used instead of requesting it, if the run
+        belongs to it.
+
+        With `only_changed` results which status is the same as of the
+        latest result of the case in the run are not sent.
+        """
+        tests = None
         if not self.include_all:
-            # IDs can't be taken from self.case_ids set because it's always
-            # empty now, see https://goo.gl/uunbEH
-            cases_ids = [test.case_id for test in self.tests.list()]
-            missing_cases_ids = [case.id for case in cases
-                                 if case.id not in cases_ids]
+            if case_ids is None:
+                # IDs can't be taken from self.case_ids set because it's
+                # always empty now, see https://goo.gl/uunbEH
+                tests = self.tests.list()
+                case_ids = [test.case_id for test in tests]
+            present = set(case_ids)
+            missing_cases_ids = []
+            for case in cases:
+                if case.id not in present:
+                    present.add(case.id)
+                    missing_cases_ids.append(case.id)
             if missing_cases_ids:
                 logger.debug('Adding {0} missing test cases '
                              'to the run'.format(len(missing_cases_ids)))
-                self.case_ids = cases_ids + missing_cases_ids
-                run_data = self.get(self.id)
-                if hasattr(run_data, 'plan_id') and run_data.plan_id:
-                    Plan.get(id=self.plan_id).update_run(run=self)
-                else:
-                    self.update()
+                self.case_ids = list(case_ids) + missing_cases_ids
+                self._update_cases(plan)
+        if only_changed:
+            cases = self.changed_cases(cases, tests)
+            if not cases:
+                logger.info('Results of run {} are not changed'.format(
+                    self.id))
+                return []
         return self.results.add_for_cases(self.id, cases)
 
+    def _update_cases(self, plan=None):
+        if 'plan_id' in self.data:
+            plan_id = self.data['plan_id']
+        else:
+            plan_id = self.get(self.id).data.get('plan_id')
+        if not plan_id:
+            self.update()
+            return
+        if plan is None or plan.id != plan_id or not plan.has_run(self.id):
+            plan = Plan.get(id=plan_id)
+        plan.update_run(run=self)
+
 
 class Test(Item):
     pass
@@ -398,7 +645,30 @@ class ResultCollection(Collection):
 
     _list_url = 'get_results_for_run'
 
+    def _chunks(self, results):
+        """Split serialized results to chunks bounded by count and size"""
+        max_count = self._item_class._results_chunk_size
+        max_bytes = self._item_class._results_chunk_bytes
+        chunks = []
+        chunk, size = [], 0
+        for result in results:
+            full = len(chunk) >= max_count
+            if chunk and (full or size + len(result) > max_bytes):
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(result)
+            size += len(result) + 2
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
     def add_for_cases(self, run_id, cases):
+        """Send results of cases.
+
+        Results are sent in chunks of `_results_chunk_size` results and up
+        to `_results_chunk_bytes` bytes, `_results_workers` chunks at once.
+        Each chunk is retried on its own.
+        """
         if len(cases) == 0:
             logger.warning('No cases with result for run {}'.format(run_id))
             return
@@ -408,13 +678,31 @@ class ResultCollection(Collection):
                 continue
             result = case.result.data
             result['case_id'] = case.id
-            results.append(result)
-        if results is not None:
-            url = 'add_results_for_cases/{}'.format(run_id)
-            result = self._handler('POST', url, json={'results': results})
-            return [self._to_object(x) for x in result]
+            results.append(json.dumps(result).encode('utf-8'))
+        url = 'add_results_for_cases/{}'.format(run_id)
+
+        def send(chunk):
+            body = b'{"results": [' + b', '.join(chunk) + b']}'
+            started = time.time()
+            result = self._handler('POST', url, data=body)
+            return result, time.time() - started
+
+        chunks = self._chunks(results)
+        workers = min(self._item_class._results_workers, len(chunks))
+        if workers > 1:
+            with ThreadPoolExecutor(workers) as pool:
+                sent = list(pool.map(send, chunks))
         else:
-            return []
+            sent = [send(chunk) for chunk in chunks]
+        if sent:
+            latencies = sorted(latency for _, latency in sent)
+            logger.info('{} results were sent to run {} in {} chunks, chunk '
+                        'latency min {:.1f} / median {:.1f} / max {:.1f} '
+                        'sec'.format(len(results), run_id, len(sent),
+                                     latencies[0],
+                                     latencies[len(latencies) // 2],
+                                     latencies[-1]))
+        return [self._to_object(x) for result, _ in sent for x in result]
 
 
 class Result(Item):
@@ -441,7 +729,7 @@ class Result(Item):
 
 
 class Milestone(Item):
-    pass
+    _filters = frozenset(['is_completed', 'is_started'])
 
 
 class Config(Item):
@@ -449,14 +737,108 @@ class Config(Item):
 
 
 class Client(object):
-    def __init__(self, base_url, username, password, request_timeout=600):
+    def __init__(self, base_url, username, password, request_timeout=600,
+                 pool_size=10, session=None, connect_timeout=10,
+                 read_timeout=300, retry_policy=None, rate_limit=None,
+                 rate_burst=None, pagination_workers=1, cache_dir=None,
+                 cache_ttls=None, cache_max_size=512 * 1024 * 1024,
+                 results_chunk_size=500, results_chunk_bytes=4 * 1024 * 1024,
+                 results_workers=1, compress_threshold=None):
         self.username = username
         self.password = password
         self.request_timeout = request_timeout
         self.base_url_root = base_url.rstrip('/') + '/index.php?'
         self.base_url = self.base_url_root + '/api/v2/'
+        self.session = session or self._make_session(pool_size)
+        self.retry_policy = retry_policy or RetryPolicy(
+            deadline=request_timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout)
+        self.rate_limiter = None
+        if rate_limit:
+            self.rate_limiter = TokenBucket(rate_limit, rate_burst)
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        # Request bodies larger than this (bytes) are sent gzipped
+        self.compress_threshold = compress_threshold
+
+        self.cache = None
+        if cache_dir:
+            self.cache = ResponseCache(cache_dir, ttls=cache_ttls,
+                                       max_size=cache_max_size,
+                                       namespace=self.base_url + username)
 
         Item._handler = self._query
+        Item._pagination_workers = pagination_workers
+        Item._response_cache = self.cache
+        Item._results_chunk_size = results_chunk_size
+        Item._results_chunk_bytes = results_chunk_bytes
+        Item._results_workers = results_workers
+
+    def _make_session(self, pool_size):
+        """Make a keep-alive session with a connection pool.
+
+        Connections (and their TLS state) are reused between API calls,
+        so only the first request to TestRail pays for the handshake.
+        Retries are made by `_query`, so the adapter doesn't retry itself.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        return session
+
+    def _encode_body(self, headers, kwargs):
+        """Serialize JSON body and gzip it if it's larger than threshold"""
+        if 'json' in kwargs:
+            kwargs['data'] = json.dumps(kwargs.pop('json')).encode('utf-8')
+        body = kwargs.get('data')
+        if isinstance(body, str):
+            body = kwargs['data'] = body.encode('utf-8')
+        if not body:
+            return 0
+        threshold = self.compress_threshold
+        if threshold is not None and len(body) > threshold:
+            kwargs['data'] = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+            logger.debug('Request body is compressed from {} to {} '
+                         'bytes'.format(len(body), len(kwargs['data'])))
+        return len(kwargs['data'])
+
+    @staticmethod
+    def _received_bytes(response):
+        """Return size of response body as it was sent by server"""
+        try:
+            return response.raw.tell()
+        except (AttributeError, ValueError, OSError):
+            return len(response.content)
+
+    def _count(self, **values):
+        """Add values to stats, requests are made from several threads"""
+        with self._stats_lock:
+            self.stats.update(values)
+
+    def close(self):
+        if self.stats['retries'] or self.stats['throttle_time']:
+            logger.info('{requests} requests to TestRail were made with '
+                        '{retries} retries, {wait_time:.1f} sec spent '
+                        'waiting for retries, {throttle_time:.1f} sec spent '
+                        'under rate limit'.format_map(self.stats))
+        if self.stats['requests']:
+            logger.info('{bytes_sent} bytes were sent to TestRail and '
+                        '{bytes_received} bytes received'.format_map(
+                            self.stats))
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def _query(self, method, url, extra_headers=None, **kwargs):
         if url.startswith('/api/v2/'):
@@ -468,55 +850,84 @@ class Client(object):
         headers = {'Content-type': 'application/json'}
         if extra_headers:
             headers.update(extra_headers)
+        body_size = self._encode_body(headers, kwargs)
 
         logger.debug('Make {} request to {}'.format(method, url))
 
-        def _time_sleep(resp, min_interval=300, max_interval=600):
-            if resp is None:
-                logger.info("Connection error to {}".format(url))
-            else:
-                logger.info("Request error to {0}\n"
-                            "status_code: {1.status_code}\n"
-                            "headers: {1.headers}\n"
-                            "content: '{1.content}'".format(url, resp))
-            sleep = random.randint(min_interval, max_interval)
-            logger.info("Waiting for {} sec until next try".format(sleep))
-            time.sleep(sleep)
-
+        policy = self.retry_policy
         start_time = time.time()
+        deadline = start_time + policy.deadline
+        waited = 0
+        attempt = 0
         while True:
+            error = None
+            if self.rate_limiter is not None:
+                throttled = self.rate_limiter.acquire(
+                    write=method.upper() != 'GET')
+                self._count(throttle_time=throttled)
             try:
-                response = requests.request(
+                response = self.session.request(
                     method,
                     url,
                     allow_redirects=False,
                     auth=(self.username, self.password),
                     headers=headers,
+                    timeout=policy.timeout(deadline - time.time()),
                     **kwargs)
+                self._count(bytes_sent=body_size)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Request may be already processed by server if response
+                # is timed out, so only GET is safe to repeat in this case
+                is_read_timeout = isinstance(e, requests.ReadTimeout)
+                if is_read_timeout and method.upper() != 'GET':
+                    raise
+                response = None
+                error = e
+            else:
+                self._count(bytes_received=self._received_bytes(response))
                 if response.status_code < 300:
                     # Request processed successfuly
                     break
+                if not policy.is_retryable(response):
+                    raise requests.HTTPError(
+                        "Wrong response:\n"
+                        "status_code: {0.status_code}\n"
+                        "headers: {0.headers}\n"
+                        "content: '{0.content}'".format(response),
+                        response=response)
 
-            except requests.ConnectionError:
-                response = None
-
-            if start_time + self.request_timeout > time.time():
-                _time_sleep(response)
-                continue
-
-            # Out of tries, raise an error
-            # ----------------------------
-
-            # Raise the original requests.ConnectionError
             if response is None:
-                raise
-            # Redirect or error
-            raise requests.HTTPError("Wrong response after trying {1} sec:\n"
-                                     "status_code: {0.status_code}\n"
-                                     "headers: {0.headers}\n"
-                                     "content: '{0.content}'".format(response,
-                                                              self.request_timeout),
-                                     response=response)
+                logger.info("Connection error to {}: {}".format(url, error))
+            else:
+                logger.info("Request error to {0}\n"
+                            "status_code: {1.status_code}\n"
+                            "headers: {1.headers}\n"
+                            "content: '{1.content}'".format(url, response))
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                # Out of tries, raise an error
+                if error is not None:
+                    raise error
+                raise requests.HTTPError(
+                    "Wrong response after trying {1} sec:\n"
+                    "status_code: {0.status_code}\n"
+                    "headers: {0.headers}\n"
+                    "content: '{0.content}'".format(response,
+                                                    policy.deadline),
+                    response=response)
+
+            sleep = min(policy.delay(attempt, response), remaining)
+            logger.info("Waiting for {:.1f} sec until next try".format(sleep))
+            time.sleep(sleep)
+            waited += sleep
+            attempt += 1
+
+        self._count(requests=1, retries=attempt, wait_time=waited)
+        log = logger.info if waited else logger.debug
+        log('{} request to {} took {:.1f} sec, {:.1f} sec of them waiting '
+            'for retries'.format(method, url, time.time() - start_time,
+                                 waited))
         result = response.json()
         if 'error' in result:
             logger.warning(result)
@@ -528,5 +939,10 @@ class Client(object):
 
     @property
     def statuses(self):
-        statuses = self._query('GET', 'get_statuses')
+        url = 'get_statuses'
+        if self.cache is not None and self.cache.cacheable(url):
+            statuses = self.cache.fetch(
+                url, None, lambda params: self._query('GET', url))
+        else:
+            statuses = self._query('GET', url)
         return {x['id']: x['name'] for x in statuses}
@@ -0,0 +1,160 @@
+from __future__ import absolute_import
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from .cache import CLOCK_SKEW
+from .cache import ResponseCache
+from .client import Case
+from .client import Config
+from .client import ItemSet
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS suites (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    suite_id INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    suite_id INTEGER,
+    position INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS configs (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    full_synced_at REAL,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS cases_suite ON cases (suite_id, position);
+CREATE INDEX IF NOT EXISTS sections_suite ON sections (suite_id);
+'''
+
+
+class Mirror(object):
+    """Local SQLite copy of project suites, sections, cases and configs.
+
+    Cases are synced incrementally with `updated_after` filter, full sync
+    (which also drops deleted cases) is made each `full_sync_interval` sec.
+    """
+
+    def __init__(self, path,
+                 full_sync_interval=ResponseCache.default_ttls['get_cases']):
+        self.path = path
+        self.full_sync_interval = full_sync_interval
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _get_state(self, name):
+        row = self.conn.execute(
+            'SELECT full_synced_at, synced_at FROM sync_state WHERE name = ?',
+            (name, )).fetchone()
+        return row or (None, None)
+
+    def _set_state(self, name, full_synced_at, synced_at):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)',
+            (name, full_synced_at, synced_at))
+
+    def sync_project(self, project):
+        """Replace project suites and configs"""
+        suites = project.suites._list('suite')
+        configs = project.configs._list('config')
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM suites WHERE project_id = ?',
+                              (project.id, ))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO suites VALUES (?, ?, ?)',
+                [(x['id'], project.id, json.dumps(x)) for x in suites])
+            self.conn.execute('DELETE FROM configs WHERE project_id = ?',
+                              (project.id, ))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO configs VALUES (?, ?, ?)',
+                [(x['id'], project.id, json.dumps(x)) for x in configs])
+
+    def sync_suite(self, suite):
+        """Replace suite sections and apply case changes since last sync"""
+        state_name = 'cases:{}'.format(suite.id)
+        started = time.time()
+        sections = suite.sections
+        with self._lock:
+            full_synced_at, synced_at = self._get_state(state_name)
+        full_sync = full_synced_at is None
+        if not full_sync:
+            full_sync = started - full_synced_at > self.full_sync_interval
+        # Cases are read past the response cache, it may be stale
+        url = suite.cases._get_list_url('case')
+        if full_sync:
+            cases = Case._load_list(url, 'case')
+            full_synced_at = started
+        else:
+            params = {'updated_after': int(synced_at) - CLOCK_SKEW}
+            cases = Case._load_list(url, 'case', params=params)
+        logger.debug('Sync {} {} cases of suite {} to mirror'.format(
+            len(cases), 'all' if full_sync else 'changed', suite.id))
+
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM sections WHERE suite_id = ?',
+                              (suite.id, ))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO sections VALUES (?, ?, ?)',
+                [(x['id'], suite.id, json.dumps(x)) for x in sections])
+            if full_sync:
+                self.conn.execute('DELETE FROM cases WHERE suite_id = ?',
+                                  (suite.id, ))
+            position, = self.conn.execute(
+                'SELECT COALESCE(MAX(position), 0) FROM cases '
+                'WHERE suite_id = ?', (suite.id, )).fetchone()
+            for case in cases:
+                updated = self.conn.execute(
+                    'UPDATE cases SET data = ? WHERE id = ?',
+                    (json.dumps(case), case['id'])).rowcount
+                if not updated:
+                    position += 1
+                    self.conn.execute(
+                        'INSERT INTO cases VALUES (?, ?, ?, ?)',
+                        (case['id'], suite.id, position, json.dumps(case)))
+            self._set_state(state_name, full_synced_at, started)
+
+    def cases(self, suite_id):
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT data FROM cases WHERE suite_id = ? ORDER BY position',
+                (suite_id, )).fetchall()
+        items = ItemSet(Case(**json.loads(data)) for data, in rows)
+        items._item_class = Case
+        return items
+
+    def sections(self, suite_id):
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT data FROM sections WHERE suite_id = ? ORDER BY id',
+                (suite_id, )).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def configs(self, project_id):
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT data FROM configs WHERE project_id = ? ORDER BY id',
+                (project_id, )).fetchall()
+        items = ItemSet(Config(**json.loads(data)) for data, in rows)
+        items._item_class = Config
+        return items
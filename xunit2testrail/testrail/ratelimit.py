@@ -0,0 +1,54 @@
+from __future__ import absolute_import
+import threading
+import time
+
+
+class TokenBucket(object):
+    """Client-side limiter of requests rate.
+
+    Bucket holds up to `burst` tokens and is refilled with `rate` tokens
+    per minute, each request takes one token. Writes have priority: while
+    any write waits for a token, reads are not served.
+
+    :param rate: requests per minute
+    :param burst: max number of requests which may be made at once
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate / 60.0
+        self.capacity = burst or max(1, int(self.rate))
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._writers = 0
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, write=False):
+        """Take a token, blocking until it is available.
+
+        Returns time (sec) spent waiting.
+        """
+        start = time.monotonic()
+        with self._cond:
+            if write:
+                self._writers += 1
+            try:
+                while True:
+                    self._refill()
+                    ready = write or not self._writers
+                    if ready and self.tokens >= 1:
+                        self.tokens -= 1
+                        return time.monotonic() - start
+                    if ready:
+                        self._cond.wait((1 - self.tokens) / self.rate)
+                    else:
+                        self._cond.wait()
+            finally:
+                if write:
+                    self._writers -= 1
+                    self._cond.notify_all()
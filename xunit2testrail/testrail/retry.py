@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+from email.utils import parsedate_to_datetime
+import datetime
+import random
+
+
+class RetryPolicy(object):
+    """Decides whether a failed request should be repeated and when.
+
+    :param deadline: total time (sec) for all tries of a single request
+    :param backoff_base: delay (sec) before the first retry
+    :param backoff_max: upper bound of a single delay (sec)
+    :param connect_timeout: timeout of establishing a connection (sec)
+    :param read_timeout: timeout of waiting for a response (sec)
+    """
+
+    # 409 - TestRail maintenance, 429 - API rate limit
+    retry_statuses = frozenset([409, 429, 500, 502, 503, 504])
+
+    def __init__(self, deadline=600, backoff_base=1, backoff_max=120,
+                 connect_timeout=10, read_timeout=300):
+        self.deadline = deadline
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def is_retryable(self, response):
+        """Check that request failed with `response` may succeed later.
+
+        `response` is None for connection errors.
+        """
+        if response is None:
+            return True
+        return response.status_code in self.retry_statuses
+
+    def timeout(self, remaining):
+        """Return (connect, read) timeouts which fit into `remaining` sec."""
+        remaining = max(remaining, 1)
+        return (min(self.connect_timeout, remaining),
+                min(self.read_timeout, remaining))
+
+    def delay(self, attempt, response=None):
+        """Return delay (sec) before the next try.
+
+        Server's `Retry-After` header takes precedence, otherwise it is
+        exponential backoff with full jitter.
+        """
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, backoff)
+
+    @staticmethod
+    def retry_after(response):
+        if response is None:
+            return None
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        now = datetime.datetime.now(date.tzinfo)
+        return max((date - now).total_seconds(), 0)
@@ -1,5 +1,9 @@
 import abc
+import contextlib
+import os
 import re
+import string
+import tempfile
 from uuid import UUID
 from collections import defaultdict
 import logging
@@ -10,6 +14,23 @@ import six
 logger = logging.getLogger(__name__)
 
 
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """Write to a temporary file, which replaces `path` when done
+
+    Readers never see a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    os.replace(tmp_name, path)
+
+
 def find_id(methodname):
     """Returns test id from name
     For example if test name is "test_ban_l3_agent[once][(12345)]"
@@ -39,6 +60,50 @@ def find_uuid(methodname):
             pass
 
 
+def template_fields(template):
+    """Returns names of fields used in format string template
+    For example for "{classname}.{methodname[0]}" it returns
+    ["classname", "methodname"]
+    """
+    fields = []
+    for _, field, _, _ in string.Formatter().parse(template):
+        if field:
+            name = re.match(r'[^.[]*', field).group(0)
+            if name not in fields:
+                fields.append(name)
+    return fields
+
+
+class Template(object):
+    """Format string template, which is parsed once.
+
+    Templates with plain fields only (like "{classname}.{methodname}")
+    are rendered by joining parts, others are passed to `str.format`.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.fields = template_fields(template)
+        self._parts = []
+        parsed = string.Formatter().parse(template)
+        for literal, field, spec, conversion in parsed:
+            plain = field is None or field.isidentifier()
+            if spec or conversion or not plain:
+                self._parts = None
+                break
+            self._parts.append((literal, field))
+
+    def format(self, values):
+        if self._parts is None:
+            return self.template.format(**values)
+        result = ''
+        for literal, field in self._parts:
+            result += literal
+            if field is not None:
+                result += str(values[field])
+        return result
+
+
 class NoneValueException(Exception):
     """None value exception class."""
 
@@ -64,22 +129,28 @@ class NotNoneValue(object):
 
 @six.add_metaclass(abc.ABCMeta)
 class CaseMapper(object):
-    def describe_xunit_case(self, case):
-        xunit_dict = {
-            'classname': case.classname,
-            'methodname': case.methodname,
-            'description': case.description,
-            'id': case.report_id or find_id(case.methodname),
-            'uuid': find_uuid(case.methodname)
-        }
-
-        return {k: NotNoneValue(v) for k, v in xunit_dict.items()}
-
-    def describe_testrail_case(self, case):
-        return {
-            k: v
-            for k, v in case.data.items() if isinstance(v, six.string_types)
-        }
+    xunit_fields = {
+        'classname': lambda case: case.classname,
+        'methodname': lambda case: case.methodname,
+        'description': lambda case: case.description,
+        'id': lambda case: case.report_id or find_id(case.methodname),
+        'uuid': lambda case: find_uuid(case.methodname),
+    }
+
+    def describe_xunit_case(self, case, fields=None):
+        """Return xUnit case fields (all or only listed in `fields`)"""
+        if fields is None:
+            fields = self.xunit_fields
+        return {k: NotNoneValue(self.xunit_fields[k](case))
+                for k in fields if k in self.xunit_fields}
+
+    def describe_testrail_case(self, case, fields=None):
+        """Return TestRail case string fields (all or only listed)"""
+        if fields is None:
+            fields = case.data
+        data = case.data
+        return {k: data[k] for k in fields
+                if isinstance(data.get(k), six.string_types)}
 
     def print_pair_data(self, testrail_case, xunit_case):
         testrail_fields = self.describe_testrail_case(testrail_case)
@@ -150,7 +221,9 @@ class CaseMapper(object):
         logger.info("Available custom fields for cases: \n{}"
                     .format("\n".join(custom_case_items)))
 
+        xunit_cases_count = 0
         for xunit_case in xunit_suite:
+            xunit_cases_count += 1
             if not send_skipped and xunit_case.skipped:
                 # Do not create test cases for skipped results
                 # if send_skipped==False
@@ -197,7 +270,7 @@ class CaseMapper(object):
             for testrail_case in suitable_cases:
                 mapping.append((testrail_case, xunit_case))
 
-        if len(mapping) == 0 and all([xunit_suite.countTestCases(),
+        if len(mapping) == 0 and all([xunit_cases_count,
                                       len(testrail_cases)]):
             self.print_pair_data(testrail_cases[-1], xunit_case)
         self._check_collisions(mapping, allow_duplicates=allow_duplicates)
@@ -207,28 +280,100 @@ class CaseMapper(object):
 class TemplateCaseMapper(CaseMapper):
     """Template string based mapper."""
 
+    # Symbols groups, which are used to split TestRail id if absent
+    # in xUnit id
+    split_symbols_base = [r'a-zA-Z', r'\(\)', r'\[\]', r',', ]
+
     def __init__(self, xunit_name_template, testrail_name_template,
                  testrail_case_max_name_lenght=0, **kwargs):
         super(TemplateCaseMapper, self).__init__(**kwargs)
         self.xunit_name_template = xunit_name_template
         self.testrail_name_template = testrail_name_template
         self.testrail_case_max_name_lenght = testrail_case_max_name_lenght
-
-    def get_xunit_id(self, xunit_case):
-        """Extract xUnit case fields and compose a case title for TestRail"""
-        xunit_dict = self.describe_xunit_case(xunit_case)
-        xunit_id = self.xunit_name_template.format(**xunit_dict)
+        self._split_groups = [(group, re.compile(r'[{}]'.format(group)))
+                              for group in self.split_symbols_base]
+        self._indexed_key = None
+        self._indexed_cases = None
+        self._indexes = {}
+        self._templates = {}
+        # (case, template key, id) of the last described xUnit case
+        self._last_xunit_id = None
+
+    def _get_template(self, template):
+        compiled = self._templates.get(template)
+        if compiled is None:
+            compiled = self._templates[template] = Template(template)
+        return compiled
+
+    def _make_xunit_id(self, xunit_case, template):
+        xunit_dict = self.describe_xunit_case(xunit_case, template.fields)
+        xunit_id = template.format(xunit_dict)
         if self.testrail_case_max_name_lenght:
             return str(xunit_id)[:self.testrail_case_max_name_lenght]
         else:
             return xunit_id
 
+    def get_xunit_id(self, xunit_case):
+        """Extract xUnit case fields and compose a case title for TestRail
+
+        Result is kept for the last case only, so it is computed once
+        while the case is mapped and mapped cases aren't held.
+        """
+        template = self._get_template(self.xunit_name_template)
+        key = (template, self.testrail_case_max_name_lenght)
+        cached = self._last_xunit_id
+        if cached is None or cached[0] is not xunit_case \
+                or cached[1] != key:
+            try:
+                result = self._make_xunit_id(xunit_case, template)
+            except NoneValueException as e:
+                result = e
+            cached = self._last_xunit_id = (xunit_case, key, result)
+        result = cached[2]
+        if isinstance(result, NoneValueException):
+            raise NoneValueException(*result.args)
+        return result
+
     def get_xunit_descr(self, xunit_case):
-        xunit_dict = self.describe_xunit_case(xunit_case)
-        if 'description' in xunit_dict:
-            return xunit_dict['description']
-        else:
-            return xunit_dict['methodname']
+        return self.describe_xunit_case(xunit_case, ['description'])[
+            'description']
+
+    def get_testrail_id(self, case):
+        template = self._get_template(self.testrail_name_template)
+        case_data = self.describe_testrail_case(case, template.fields)
+        return template.format(case_data)
+
+    def get_cases_index(self, cases, split_symbols):
+        """Return mapping of TestRail ids parts to cases.
+
+        TestRail ids are split with `split_symbols` (or not split if it is
+        empty). Each case is present in the list of a part as many times as
+        this part occurs in its id. Indexes are built once for `cases` list.
+        """
+        indexed_key = (id(cases), len(cases), self.testrail_name_template)
+        if self._indexed_key != indexed_key:
+            self._indexed_key = indexed_key
+            # Keep reference to indexed list, so its id can't be reused
+            self._indexed_cases = cases
+            self._testrail_ids = [(case, self.get_testrail_id(case))
+                                  for case in cases]
+            self._indexes = {}
+
+        index = self._indexes.get(split_symbols)
+        if index is not None:
+            return index
+        index = self._indexes[split_symbols] = defaultdict(list)
+        if not split_symbols:
+            for case, testrail_id in self._testrail_ids:
+                index[testrail_id].append(case)
+            return index
+        split_expr = re.compile(r'[{}]'.format(split_symbols))
+        for case, testrail_id in self._testrail_ids:
+            groups = [x for x in split_expr.split(testrail_id) if x]
+            groups.reverse()
+            for group in groups:
+                index[group].append(case)
+        return index
 
     def get_suitable_cases(self, xunit_case, cases):
         try:
@@ -240,32 +385,19 @@ class TemplateCaseMapper(CaseMapper):
             return []
 
         # Search symbols groups, which is absent in xunit_id
-        split_symbols_base = [r'a-zA-Z', r'\(\)', r'\[\]', r',', ]
         split_symbols = ''
-        for group in split_symbols_base:
-            if re.search(r'[{}]'.format(group), xunit_id) is None:
+        for group, group_expr in self._split_groups:
+            if group_expr.search(xunit_id) is None:
                 split_symbols += group
 
-        split_expr = re.compile(r'[{}]'.format(split_symbols))\
-            if split_symbols else None
-        match_cases = []
-        for case in cases:
-            case_data = self.describe_testrail_case(case)
-            testrail_id = self.testrail_name_template.format(**case_data)
-
-            if split_expr is None:
-                if xunit_id == testrail_id:
-                    match_cases.append(case)
-            else:
-                groups = [x for x in split_expr.split(testrail_id) if x]
-                groups.reverse()
-                for group in groups:
-                    if group == xunit_id:
-                        match_cases.append(case)
-        return match_cases
+        index = self.get_cases_index(cases, split_symbols)
+        return list(index.get(xunit_id, ()))
 
 
 def truncate_head(banner, text, max_len):
+    if hasattr(text, 'tail'):
+        # Decode only the end of lazy text, which can be kept
+        text = text.tail(max(max_len - len(banner), 0) + 1)
     max_text_len = min(max_len - len(banner), len(text))
     start = '...\n'
     if max_text_len < len(text):
@@ -0,0 +1,493 @@
+from __future__ import absolute_import
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import gc
+import glob
+import gzip
+import hashlib
+from itertools import repeat
+import json
+import logging
+import lzma
+import mmap
+import multiprocessing
+import os
+import pickle
+import re
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+from .utils import atomic_write
+from .vendor import xunitparser
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+REPORT_SUFFIXES = ('.xml', '.xml.gz', '.xml.xz', '.xml.zst')
+CASE_FIELDS = xunitparser.TestCase.__slots__
+CASE_TIME = CASE_FIELDS.index('time')
+
+# Start tag with possible '>' in quoted attribute values
+START_TAG_RE = re.compile(
+    br'''<[^\s/>]+(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*(/?)>''')
+UTF8_CONTINUATION = bytes(range(0x80, 0xc0))
+XML_WHITESPACE = b' \t\r\n'
+
+
+class LazyText(object):
+    """Text of an element, which is read from the report file on demand.
+
+    Only file path and byte offsets of the element content are kept, so
+    large outputs of test cases cost nothing until they are used.
+    """
+
+    __slots__ = ('path', 'start', 'end', 'encoding', 'stripped', 'bounds')
+
+    def __init__(self, path, start, end, encoding='utf-8', stripped=False,
+                 bounds=None):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.encoding = encoding
+        self.stripped = stripped
+        # Offsets of the content without leading and trailing whitespace
+        self.bounds = bounds
+
+    def __reduce__(self):
+        return (LazyText, (self.path, self.start, self.end, self.encoding,
+                           self.stripped, self.bounds))
+
+    def _read(self, start, end):
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def _decode(self, raw):
+        if b'&' not in raw and b'<' not in raw and b'\r' not in raw:
+            return raw.decode(self.encoding)
+        # Entities, CDATA and line endings are resolved by XML parser
+        decl = '<?xml version="1.0" encoding="{}"?>'.format(self.encoding)
+        wrapped = b''.join([decl.encode('ascii'), b'<x>', raw, b'</x>'])
+        return ElementTree.fromstring(wrapped).text or ''
+
+    def strip(self):
+        """Return text without leading and trailing whitespace"""
+        start, end = self.bounds or (self.start, self.end)
+        return LazyText(self.path, start, end, self.encoding, True,
+                        (start, end))
+
+    def tail(self, size):
+        """Return last `size` chars of the text decoding only them"""
+        window = size * 4 + 64
+        if self.end - self.start <= window:
+            return str(self)[-size:]
+        raw = self._read(self.end - window, self.end)
+        # Skip a char or an entity, which may be cut by the window start
+        raw = raw.lstrip(UTF8_CONTINUATION)
+        amp, semicolon = raw.find(b'&'), raw.find(b';')
+        if semicolon != -1 and (amp == -1 or semicolon < amp):
+            raw = raw[semicolon + 1:]
+        try:
+            text = self._decode(raw)
+        except (ElementTree.ParseError, UnicodeDecodeError):
+            # Window starts inside of CDATA section or a comment
+            text = ''
+        if self.stripped:
+            text = text.rstrip()
+        if len(text) < size:
+            return str(self)[-size:]
+        return text[-size:]
+
+    def __str__(self):
+        text = self._decode(self._read(self.start, self.end))
+        return text.strip() if self.stripped else text
+
+    def __bool__(self):
+        return self.end > self.start
+
+    __nonzero__ = __bool__
+
+    def __len__(self):
+        return len(str(self))
+
+    def __eq__(self, other):
+        if isinstance(other, LazyText):
+            other = str(other)
+        return str(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(str(self), name)
+
+    def __repr__(self):
+        return '<LazyText {} [{}:{}]>'.format(self.path, self.start, self.end)
+
+
+class _Element(object):
+    """Element of a tree built by `_LazyReader`"""
+
+    __slots__ = ('tag', 'attrib', 'text', '_children')
+
+    def __init__(self, tag, attrib):
+        self.tag = tag
+        self.attrib = attrib
+        self.text = None
+        self._children = []
+
+    def __iter__(self):
+        return iter(self._children)
+
+    def __len__(self):
+        return len(self._children)
+
+    def append(self, el):
+        self._children.append(el)
+
+    def remove(self, el):
+        self._children.remove(el)
+
+
+class _LazyReader(object):
+    """Expat based reader, which yields events like `ElementTree.iterparse`.
+
+    Text of test case output and result elements is replaced with
+    `LazyText`, other elements get text before their first child. Reports
+    which declare entities are read eagerly, as the declarations aren't
+    known when a lazy text is decoded.
+    """
+
+    payload_tags = frozenset(
+        ['system-out', 'system-err', 'failure', 'error', 'skipped'])
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.encoding = 'utf-8'
+        self.events = []
+        self.stack = []
+        self.text = None
+        self.payload = None
+        self.payload_start = None
+        self.mm = None
+        self.has_entities = False
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.XmlDeclHandler = self.xml_decl
+        self.parser.EntityDeclHandler = self.entity_decl
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.data
+
+    def xml_decl(self, version, encoding, standalone):
+        if encoding:
+            self.encoding = encoding
+
+    def entity_decl(self, *args):
+        self.has_entities = True
+
+    def start(self, tag, attrib):
+        el = _Element(tag, attrib)
+        if self.stack:
+            parent = self.stack[-1]
+            if self.text:
+                parent.text = ''.join(self.text)
+            parent.append(el)
+        self.text = []
+        if self.payload is None and not self.has_entities and self.stack and \
+                self.stack[-1].tag == 'testcase' and tag in self.payload_tags:
+            m = START_TAG_RE.match(self.mm, self.parser.CurrentByteIndex)
+            if m and not m.group(1):
+                self.payload = el
+                self.payload_start = m.end()
+                self.text = None
+        self.stack.append(el)
+        self.events.append(('start', el))
+
+    def _bounds(self, start, end):
+        while start < end and self.mm[start] in XML_WHITESPACE:
+            start += 1
+        while end > start and self.mm[end - 1] in XML_WHITESPACE:
+            end -= 1
+        return start, end
+
+    def end(self, tag):
+        el = self.stack.pop()
+        if el is self.payload:
+            start, end = self.payload_start, self.parser.CurrentByteIndex
+            if end > start:
+                el.text = LazyText(self.path, start, end, self.encoding,
+                                   bounds=self._bounds(start, end))
+            self.payload = self.payload_start = None
+        elif self.text:
+            el.text = ''.join(self.text)
+        self.text = None
+        self.events.append(('end', el))
+
+    def data(self, text):
+        if self.text is not None:
+            self.text.append(text)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for pos in range(0, len(self.mm), self.chunk_size):
+                self.parser.Parse(self.mm[pos:pos + self.chunk_size], False)
+                for event in self.events:
+                    yield event
+                del self.events[:]
+            self.parser.Parse(b'', True)
+            for event in self.events:
+                yield event
+        finally:
+            self.mm.close()
+
+
+def is_report(name):
+    return name.endswith(REPORT_SUFFIXES)
+
+
+def find_reports(paths):
+    """Expand files, directories and glob patterns to sorted report files.
+
+    Directories are searched recursively for files with `REPORT_SUFFIXES`.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    found = set()
+    for path in paths:
+        matches = [path] if os.path.exists(path) else glob.glob(path,
+                                                                recursive=True)
+        reports = set()
+        for match in matches:
+            if not os.path.isdir(match):
+                reports.add(os.path.normpath(match))
+                continue
+            for root, _, files in os.walk(match):
+                reports.update(os.path.normpath(os.path.join(root, name))
+                               for name in files if is_report(name))
+        if not reports:
+            raise IOError('No xUnit reports found at {!r}'.format(path))
+        found.update(reports)
+    return sorted(found)
+
+
+def _zstd_open(path):
+    if zstandard is None:
+        raise ImportError('{} is compressed with zstd, "zstandard" package '
+                          'is required to read it'.format(path))
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+
+
+# Compressed files are detected by content as they may have any name
+COMPRESSIONS = (
+    (b'\x1f\x8b', gzip.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+    (b'\x28\xb5\x2f\xfd', _zstd_open),
+)
+
+
+def _compression_opener(path):
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, opener in COMPRESSIONS:
+        if head.startswith(magic):
+            return opener
+    return None
+
+
+def open_report(path):
+    """Open report file for reading, decompressing it on the fly"""
+    opener = _compression_opener(path)
+    if opener is not None:
+        return opener(path)
+    return open(path, 'rb')
+
+
+class ReportCache(object):
+    """On-disk cache of parsed reports.
+
+    Cases of a report are pickled to `path` and keyed by sha256 of the
+    report content. Size, mtime and hash of each seen report are kept in
+    index files, so an unchanged report is not hashed again.
+    """
+
+    # Should be changed with changes of pickled cases
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _write(self, name, write):
+        with atomic_write(os.path.join(self.path, name), 'wb') as f:
+            write(f)
+
+    def digest(self, path):
+        """Return sha256 of the report content"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        index_name = hashlib.sha1(path.encode('utf-8')).hexdigest() + '.json'
+        try:
+            with open(os.path.join(self.path, index_name)) as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            entry = {}
+        if entry.get('size') == stat.st_size and \
+                entry.get('mtime') == stat.st_mtime_ns:
+            return entry['sha256']
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                 'sha256': sha256.hexdigest()}
+        self._write(index_name,
+                    lambda f: f.write(json.dumps(entry).encode('utf-8')))
+        return entry['sha256']
+
+    def _name(self, path, lazy_payloads):
+        key = [self.version, self.digest(path)]
+        if lazy_payloads:
+            # Lazy payloads refer to the report file
+            key.append(os.path.abspath(path))
+        key = json.dumps(key).encode('utf-8')
+        return hashlib.sha256(key).hexdigest() + '.pickle'
+
+    @staticmethod
+    def _dump_cases(cases):
+        # Plain tuples are pickled several times faster than objects
+        rows = []
+        for case in cases:
+            row = [getattr(case, name, None) for name in CASE_FIELDS]
+            if row[CASE_TIME] is not None:
+                row[CASE_TIME] = row[CASE_TIME].total_seconds()
+            rows.append(tuple(row))
+        return rows
+
+    @staticmethod
+    def _load_cases(rows):
+        cases = []
+        case_class = xunitparser.TestCase
+        for row in rows:
+            case = case_class.__new__(case_class)
+            for name, value in zip(CASE_FIELDS, row):
+                setattr(case, name, value)
+            if case.time is not None:
+                case.time = timedelta(seconds=case.time)
+            cases.append(case)
+        return cases
+
+    def load(self, path, lazy_payloads=False):
+        """Return cached cases of the report or None"""
+        name = self._name(path, lazy_payloads)
+        # Collector only slows down creation of many objects here
+        gc.disable()
+        try:
+            with open(os.path.join(self.path, name), 'rb') as f:
+                cases = self._load_cases(pickle.load(f))
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+        finally:
+            gc.enable()
+        logger.debug('Use cached cases of {}'.format(path))
+        return cases
+
+    def store(self, path, cases, lazy_payloads=False):
+        name = self._name(path, lazy_payloads)
+        rows = self._dump_cases(cases)
+        self._write(name, lambda f: pickle.dump(rows, f,
+                                                pickle.HIGHEST_PROTOCOL))
+
+
+def iter_report(path, backend='auto', lazy_payloads=False):
+    """Yield cases of a single report file.
+
+    With `lazy_payloads` outputs and traces of cases in uncompressed
+    reports are read from the file only when used (see `LazyText`).
+    """
+    if lazy_payloads and _compression_opener(path) is None:
+        events = _LazyReader(path)
+        for case in xunitparser.Parser(backend).iterevents(events):
+            yield case
+        return
+    with open_report(path) as f:
+        for case in xunitparser.iterparse(f, backend=backend):
+            yield case
+
+
+def parse_report(path, backend='auto', lazy_payloads=False, cache_dir=None):
+    """Return list of cases of a single report file.
+
+    Cases are taken from `ReportCache` in `cache_dir` if it is set.
+    """
+    cache = ReportCache(cache_dir) if cache_dir else None
+    if cache is not None:
+        cases = cache.load(path, lazy_payloads)
+        if cases is not None:
+            return cases
+    cases = list(iter_report(path, backend, lazy_payloads))
+    if cache is not None:
+        cache.store(path, cases, lazy_payloads)
+    return cases
+
+
+def iter_cases(paths, backend='auto', workers=None, lazy_payloads=False,
+               cache_dir=None):
+    """Yield cases of all reports in the order of `paths`.
+
+    Several reports are parsed in a pool of `workers` processes (number of
+    CPUs by default), a single report is streamed while it is parsed.
+    """
+    if len(paths) == 1 or workers == 1:
+        for path in paths:
+            if cache_dir:
+                cases = parse_report(path, backend, lazy_payloads, cache_dir)
+            else:
+                cases = iter_report(path, backend, lazy_payloads)
+            for case in cases:
+                yield case
+        return
+    logger.debug('Parse {} xUnit reports in parallel'.format(len(paths)))
+    # Workers aren't forked from this process, as other threads (e.g. TestRail
+    # warm-up) may hold locks at the moment
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+    else:
+        context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        for cases in pool.map(parse_report, paths, repeat(backend),
+                              repeat(lazy_payloads), repeat(cache_dir)):
+            for case in cases:
+                yield case
+
+
+def parse_reports(paths, backend='auto', workers=None, lazy_payloads=False,
+                  cache_dir=None):
+    """Return suite and result merged from all reports"""
+    if len(paths) == 1 and not lazy_payloads and not cache_dir:
+        with open_report(paths[0]) as f:
+            return xunitparser.parse(f, backend=backend)
+    ts = xunitparser.TestSuite(
+        iter_cases(paths, backend, workers, lazy_payloads, cache_dir))
+    return ts, xunitparser.TestResult(ts)